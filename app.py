@@ -1,15 +1,45 @@
-from flask import Flask
+from flask import Flask, Response, jsonify
 from flask_cors import CORS
 from rag.api import rag_bp
 from config import Config
+import metrics
+from db import pool_stats
+from rag.embeddings import cache_stats
+from rag.agent import answer_cache_stats
+from rag.vector_mirror import mirror_stats
 
 app = Flask(__name__)
 CORS(app)
 
+metrics.REGISTRY.add_collector("rag_db_pool", pool_stats)
+metrics.REGISTRY.add_collector("rag_embedding_cache", cache_stats)
+metrics.REGISTRY.add_collector("rag_answer_cache", answer_cache_stats)
+metrics.REGISTRY.add_collector("rag_vector_mirror", mirror_stats)
+
 @app.get("/hello")
 def hello():
     return "Hello from Agentic RAG service"
 
+@app.get("/db/pool")
+def db_pool():
+    return jsonify(pool_stats())
+
+@app.get("/embeddings/cache")
+def embeddings_cache():
+    return jsonify(cache_stats())
+
+@app.get("/answers/cache")
+def answers_cache():
+    return jsonify(answer_cache_stats())
+
+@app.get("/vector/mirror")
+def vector_mirror_stats():
+    return jsonify(mirror_stats())
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 # expose RAG at /ask
 app.register_blueprint(rag_bp, url_prefix="/")
 
@@ -0,0 +1,134 @@
+"""
+ASGI entry point: POST /ask runs on the asyncio agent (run_agent_async), so one
+worker process holds hundreds of in-flight conversations instead of one per
+thread; every other route is served by the Flask app.
+
+    pip install -r requirements.txt   # includes asgiref, httpx, uvicorn
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import json
+import requests
+from asgiref.wsgi import WsgiToAsgi
+from app import app as flask_app
+from config import Config
+from metrics import request_breakdown
+from rag import openai_client
+from rag import tools as tools_impl
+from rag.agent import run_agent_async, run_agent_stream_async
+from rag.api import _debug_timings, _finish, _sse
+
+_flask = WsgiToAsgi(flask_app)
+
+
+async def _read_body(receive):
+    parts = []
+    while True:
+        msg = await receive()
+        parts.append(msg.get("body", b""))
+        if not msg.get("more_body"):
+            return b"".join(parts)
+
+
+def _cors(headers):
+    """The headers flask_cors' CORS(app) defaults add (any origin, reflected), for the native /ask."""
+    origin = headers.get("origin")
+    return [("access-control-allow-origin", origin), ("vary", "Origin")] if origin else []
+
+
+async def _start(send, status, content_type, extra=(), cors=()):
+    headers = [(b"content-type", content_type.encode("latin-1"))]
+    headers += [(k.encode("latin-1"), v.encode("latin-1")) for k, v in list(extra) + list(cors)]
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+
+
+async def _json(send, status, obj, cors=()):
+    await _start(send, status, "application/json", cors=cors)
+    await send({"type": "http.response.body", "body": json.dumps(obj, default=str).encode("utf-8")})
+
+
+def _openai_error(e):
+    txt = getattr(e.response, "text", "") or str(e)
+    return {"error": "openai_http", "status": getattr(e.response, "status_code", None), "detail": txt[:400]}
+
+
+async def _ask_stream(send, session_id, message, debug, cors):
+    await _start(send, 200, "text/event-stream", [("cache-control", "no-cache"), ("x-accel-buffering", "no")], cors)
+
+    async def event(name, data):
+        await send({"type": "http.response.body", "body": _sse(name, data).encode("utf-8"), "more_body": True})
+
+    status = "ok"
+    with request_breakdown() as b:
+        try:
+            async for name, data in run_agent_stream_async(session_id, message, tools_impl):
+                if name == "done" and debug:
+                    data = dict(data, timings=b.as_dict())
+                await event(name, data)
+        except requests.HTTPError as e:
+            status = "openai_http"
+            await event("error", _openai_error(e))
+        except Exception as e:
+            status = "internal"
+            flask_app.logger.exception("rag /ask stream failed")
+            await event("error", {"error": "internal", "detail": str(e)[:200]})
+        finally:
+            _finish(b, "sse", status)
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def ask(scope, receive, send):
+    """POST /ask with the same contract as rag.api.ask_post (JSON or SSE)."""
+    headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+    cors = _cors(headers)  # preflight OPTIONS requests are answered by the Flask app
+    if headers.get("x-api-key") != Config.X_API_KEY:
+        return await _json(send, 401, {"detail": "Unauthorized"}, cors)
+    try:
+        data = json.loads(await _read_body(receive) or b"{}") or {}
+    except ValueError:
+        return await _json(send, 400, {"error": "Invalid JSON body"}, cors)
+    message = data.get("message", "")
+    session_id = data.get("sessionId", "default")
+    if not message:
+        return await _json(send, 400, {"error": "No message provided"}, cors)
+    if not Config.OPENAI_API_KEY:
+        return await _json(send, 500, {"error": "OPENAI_API_KEY missing"}, cors)
+    debug = _debug_timings(data, headers)
+
+    if data.get("stream") or "text/event-stream" in headers.get("accept", ""):
+        return await _ask_stream(send, session_id, message, debug, cors)
+
+    status = "ok"
+    with request_breakdown() as b:
+        try:
+            out = {"answer": await run_agent_async(session_id, message, tools_impl)}
+            if debug:
+                out["timings"] = b.as_dict()
+            return await _json(send, 200, out, cors)
+        except requests.HTTPError as e:
+            status = "openai_http"
+            return await _json(send, 502, _openai_error(e), cors)
+        except Exception as e:
+            status = "internal"
+            flask_app.logger.exception("rag /ask failed")
+            return await _json(send, 500, {"error": "internal", "detail": str(e)[:200]}, cors)
+        finally:
+            _finish(b, "json", status)
+
+
+async def _lifespan(receive, send):
+    while True:
+        msg = await receive()
+        if msg["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif msg["type"] == "lifespan.shutdown":
+            await openai_client.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] == "http" and scope["method"] == "POST" and scope["path"].rstrip("/") == "/ask":
+        return await ask(scope, receive, send)
+    return await _flask(scope, receive, send)
@@ -16,6 +16,23 @@ def get_int_env(var_name: str, default: int) -> int:
         return default
 
 
+def get_float_env(var_name: str, default: float) -> float:
+    """Safely parse a float from environment variables with fallback."""
+    value = os.getenv(var_name, str(default))
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+
+def get_bool_env(var_name: str, default: bool) -> bool:
+    """Parse a boolean flag (1/true/yes/on) from environment variables."""
+    value = os.getenv(var_name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 class Config:
     # App
     APP_VERSION = "1.0.0"
@@ -31,17 +48,107 @@ class Config:
 
     # RAG / OpenAI
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+    # Shared keep-alive HTTP client (see rag/openai_client.py)
+    OPENAI_TIMEOUT_SECONDS = get_float_env("OPENAI_TIMEOUT_SECONDS", 120.0)
+    OPENAI_CONNECT_TIMEOUT_SECONDS = get_float_env("OPENAI_CONNECT_TIMEOUT_SECONDS", 10.0)
+    OPENAI_MAX_RETRIES = get_int_env("OPENAI_MAX_RETRIES", 2)
+    OPENAI_POOL_SIZE = get_int_env("OPENAI_POOL_SIZE", 32)
+    OPENAI_ASYNC_MAX_CONNECTIONS = get_int_env("OPENAI_ASYNC_MAX_CONNECTIONS", 512)
+    CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
     EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+    # Shortened embeddings (text-embedding-3 models; 0 = the model's full size)
+    EMBEDDING_DIMENSIONS = get_int_env("EMBEDDING_DIMENSIONS", 0)
     X_API_KEY = os.getenv("X_API_KEY", "changeme")
 
+    # Embedding cache (see rag/embeddings.py)
+    EMBED_CACHE_SIZE = get_int_env("EMBED_CACHE_SIZE", 4096)
+    EMBED_CACHE_TTL_SECONDS = get_int_env("EMBED_CACHE_TTL_SECONDS", 86400)
+    EMBED_CACHE_DB = get_bool_env("EMBED_CACHE_DB", False)
+
+    # Batched embedding requests (see rag/embeddings.py)
+    EMBED_BATCH_MAX_INPUTS = get_int_env("EMBED_BATCH_MAX_INPUTS", 512)
+    EMBED_BATCH_MAX_TOKENS = get_int_env("EMBED_BATCH_MAX_TOKENS", 100000)
+    EMBED_MAX_WORKERS = get_int_env("EMBED_MAX_WORKERS", 4)
+    EMBED_MAX_RETRIES = get_int_env("EMBED_MAX_RETRIES", 6)
+
+    # query_document_rows guards + typed dataset tables
+    SQL_STATEMENT_TIMEOUT_MS = get_int_env("SQL_STATEMENT_TIMEOUT_MS", 5000)
+    SQL_MAX_ROWS = get_int_env("SQL_MAX_ROWS", 200)
+    # Role query_document_rows switches to (SELECT on document_rows + ds_* only; created by init_db)
+    SQL_READER_ROLE = os.getenv("SQL_READER_ROLE", "").strip()
+    DATASET_MAX_INDEXES = get_int_env("DATASET_MAX_INDEXES", 16)
+
+    # Answer cache (opt-in; see rag/agent.py). Threshold 0 = exact matches only.
+    ANSWER_CACHE = get_bool_env("ANSWER_CACHE", False)
+    ANSWER_CACHE_SIZE = get_int_env("ANSWER_CACHE_SIZE", 512)
+    ANSWER_CACHE_TTL_SECONDS = get_int_env("ANSWER_CACHE_TTL_SECONDS", 3600)
+    ANSWER_CACHE_SEMANTIC_THRESHOLD = get_float_env("ANSWER_CACHE_SEMANTIC_THRESHOLD", 0.0)
+
+    # Chat history: token-budgeted selection from a per-session in-process cache
+    HISTORY_TOKEN_BUDGET = get_int_env("HISTORY_TOKEN_BUDGET", 2000)
+    HISTORY_MAX_MESSAGES = get_int_env("HISTORY_MAX_MESSAGES", 40)
+    HISTORY_COMPACT_CHARS = get_int_env("HISTORY_COMPACT_CHARS", 300)
+    HISTORY_CACHE_SESSIONS = get_int_env("HISTORY_CACHE_SESSIONS", 1024)
+    HISTORY_CACHE_TTL_SECONDS = get_int_env("HISTORY_CACHE_TTL_SECONDS", 300)
+
+    # Agent tool execution (see rag/agent.py)
+    TOOL_MAX_WORKERS = get_int_env("TOOL_MAX_WORKERS", 4)
+    TOOL_TIMEOUT_SECONDS = get_int_env("TOOL_TIMEOUT_SECONDS", 30)
+
+    # ANN search tuning (0 = keep the pgvector default); see scripts/vector_index.py
+    HNSW_EF_SEARCH = get_int_env("HNSW_EF_SEARCH", 0)
+    IVFFLAT_PROBES = get_int_env("IVFFLAT_PROBES", 0)
+    # Index storage: full | halfvec | binary; quantized modes re-rank N x candidates (see rag/vector_storage.py)
+    VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "full").strip().lower()
+    VECTOR_RERANK_FACTOR = get_int_env("VECTOR_RERANK_FACTOR", 4)
+
+    # Hybrid (full-text + vector, reciprocal rank fusion) retrieval
+    RAG_HYBRID = get_bool_env("RAG_HYBRID", False)
+    HYBRID_FULL_TEXT_WEIGHT = get_float_env("HYBRID_FULL_TEXT_WEIGHT", 1.0)
+    HYBRID_SEMANTIC_WEIGHT = get_float_env("HYBRID_SEMANTIC_WEIGHT", 1.0)
+    HYBRID_RRF_K = get_int_env("HYBRID_RRF_K", 60)
+
+    # Context packing for rag_search (see rag/tools.py): candidates re-ranked with
+    # maximal marginal relevance, then packed into a token budget for the model
+    RAG_CANDIDATES = get_int_env("RAG_CANDIDATES", 24)
+    RAG_MMR = get_bool_env("RAG_MMR", True)
+    RAG_MMR_LAMBDA = get_float_env("RAG_MMR_LAMBDA", 0.7)
+    RAG_DEDUP_SIMILARITY = get_float_env("RAG_DEDUP_SIMILARITY", 0.95)
+    RAG_CONTEXT_TOKENS = get_int_env("RAG_CONTEXT_TOKENS", 1500)
+
+    # In-process memory-mapped mirror of documents.embedding (see rag/vector_mirror.py)
+    VECTOR_MIRROR = get_bool_env("VECTOR_MIRROR", False)
+    VECTOR_MIRROR_DIR = os.getenv("VECTOR_MIRROR_DIR", "./.vector_mirror")
+    VECTOR_MIRROR_DTYPE = os.getenv("VECTOR_MIRROR_DTYPE", "float16")
+    VECTOR_MIRROR_AUTOSYNC = get_bool_env("VECTOR_MIRROR_AUTOSYNC", True)
+    VECTOR_MIRROR_RELOAD_SECONDS = get_float_env("VECTOR_MIRROR_RELOAD_SECONDS", 1.0)
+    VECTOR_MIRROR_MAX_SEGMENTS = get_int_env("VECTOR_MIRROR_MAX_SEGMENTS", 8)
+    # Per-version change markers written by the drive poller (document_changes)
+    DOCUMENT_CHANGES_RETENTION_DAYS = get_int_env("DOCUMENT_CHANGES_RETENTION_DAYS", 7)
+
     # Chunking
     CHUNK_SIZE = get_int_env("CHUNK_SIZE", 1000)
     CHUNK_OVERLAP = get_int_env("CHUNK_OVERLAP", 200)
+    # get_file_contents page size (characters)
+    FILE_CONTENTS_PAGE_CHARS = get_int_env("FILE_CONTENTS_PAGE_CHARS", 6000)
 
     # Google Drive ingestion
     GOOGLE_FOLDER_ID = os.getenv("GOOGLE_FOLDER_ID", "")
     GOOGLE_CREDENTIALS_FILE = os.getenv("GOOGLE_CREDENTIALS_FILE", "")
     POLL_INTERVAL_SECONDS = get_int_env("POLL_INTERVAL_SECONDS", 60)
+    # files().list / changes().list page size (Drive allows up to 1000)
+    DRIVE_PAGE_SIZE = get_int_env("DRIVE_PAGE_SIZE", 1000)
+
+    # Ingestion pipeline (see rag/ingestion/pipeline.py); 0 processes = one per CPU
+    INGEST_FETCH_WORKERS = get_int_env("INGEST_FETCH_WORKERS", 4)
+    INGEST_EXTRACT_PROCESSES = get_int_env("INGEST_EXTRACT_PROCESSES", 0)
+    INGEST_EMBED_WORKERS = get_int_env("INGEST_EMBED_WORKERS", 2)
+    INGEST_WRITE_WORKERS = get_int_env("INGEST_WRITE_WORKERS", 2)
+    INGEST_QUEUE_SIZE = get_int_env("INGEST_QUEUE_SIZE", 8)
+    # Streaming ingestion: chunks embedded/staged per batch, Drive download chunk size
+    INGEST_BATCH_SIZE = get_int_env("INGEST_BATCH_SIZE", 256)
+    DOWNLOAD_CHUNK_BYTES = get_int_env("DOWNLOAD_CHUNK_BYTES", 8 * 1024 * 1024)
 
     # Database (n8n-compatible envs)
     N8N_DB_CONFIG = {
@@ -52,6 +159,12 @@ class Config:
         "port": os.getenv("N8N_DB_PORT", "5432"),
     }
 
+    # Connection pool (see db.py)
+    DB_POOL_MIN = get_int_env("DB_POOL_MIN", 1)
+    DB_POOL_MAX = get_int_env("DB_POOL_MAX", 10)
+    DB_POOL_TIMEOUT_SECONDS = get_int_env("DB_POOL_TIMEOUT_SECONDS", 30)
+    DB_POOL_HEALTHCHECK_SECONDS = get_int_env("DB_POOL_HEALTHCHECK_SECONDS", 30)
+
     @staticmethod
     def DATABASE_URL() -> str:
         """Convenience DSN (used by scripts if needed)."""
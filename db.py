@@ -1,8 +1,16 @@
 import os
-import psycopg2
+import threading
+import time
 from contextlib import contextmanager
+from contextvars import ContextVar
+
+import psycopg2
+from psycopg2 import extensions, pool as pg_pool
 from dotenv import load_dotenv, find_dotenv
 
+from config import Config
+from metrics import timed
+
 REQUIRED_VARS = [
     "N8N_DB_NAME",
     "N8N_DB_USER",
@@ -26,33 +34,221 @@ def _db_config():
     }
 
 
-@contextmanager
-def get_db_connection():
+def _connect_error(e):
+    # Split long string for flake8 line-length compliance
+    return RuntimeError(
+        "Failed to connect to DB. "
+        "Check credentials/network/env vars. "
+        f"Original error: {e}"
+    )
+
+
+class ConnectionPool:
     """
-    Yield a psycopg2 connection.
+    Thread-safe psycopg2 pool that blocks (up to `timeout`) when exhausted.
 
-    On success: COMMIT.
-    On psycopg2 errors: ROLLBACK.
-    The connection is always closed.
+    psycopg2's ThreadedConnectionPool raises PoolError as soon as maxconn is
+    reached; the semaphore in front of it turns that into a bounded wait.
+    Connections idle for longer than `healthcheck_after` seconds are pinged
+    with `SELECT 1` on checkout and transparently replaced if dead.
     """
-    conn = None
-    try:
+
+    def __init__(self, minconn, maxconn, timeout, healthcheck_after, **dsn):
+        maxconn = max(1, maxconn)
+        minconn = max(0, min(minconn, maxconn))
         try:
-            conn = psycopg2.connect(**_db_config())
+            self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, **dsn)
         except psycopg2.Error as e:
-            # Split long string for flake8 line-length compliance
+            raise _connect_error(e) from e
+        self.minconn, self.maxconn = minconn, maxconn
+        self.timeout = timeout
+        self.healthcheck_after = healthcheck_after
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self._stats = {
+            "checkouts": 0,
+            "in_use": 0,
+            "timeouts": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "healthcheck_failures": 0,
+            "reconnects": 0,
+        }
+
+    def getconn(self):
+        with timed("db_checkout"):
+            return self._getconn()
+
+    def _getconn(self):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
             raise RuntimeError(
-                "Failed to connect to DB. "
-                "Check credentials/network/env vars. "
-                f"Original error: {e}"
-            ) from e
+                f"Timed out after {self.timeout}s waiting for a DB connection "
+                f"(pool max={self.maxconn})."
+            )
+        try:
+            conn = self._checkout_healthy()
+        except BaseException:
+            self._slots.release()
+            raise
+        waited = time.perf_counter() - started
+        with self._lock:
+            s = self._stats
+            s["checkouts"] += 1
+            s["in_use"] += 1
+            s["wait_seconds_total"] += waited
+            s["wait_seconds_max"] = max(s["wait_seconds_max"], waited)
+        return conn
+
+    def putconn(self, conn):
+        close = bool(conn.closed)
+        if not close and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                close = True
+        with self._lock:
+            self._stats["in_use"] -= 1
+            if close:
+                self._last_used.pop(id(conn), None)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            self._slots.release()
+
+    def _checkout_healthy(self):
+        try:
+            conn = self._pool.getconn()
+        except psycopg2.Error as e:
+            raise _connect_error(e) from e
+        if self._is_healthy(conn):
+            return conn
+        with self._lock:
+            self._stats["healthcheck_failures"] += 1
+            self._stats["reconnects"] += 1
+            self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+        try:
+            return self._pool.getconn()
+        except psycopg2.Error as e:
+            raise _connect_error(e) from e
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        last = self._last_used.get(id(conn))
+        if last is not None and time.monotonic() - last < self.healthcheck_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+        out["min"], out["max"] = self.minconn, self.maxconn
+        out["wait_seconds_avg"] = (
+            out["wait_seconds_total"] / out["checkouts"] if out["checkouts"] else 0.0
+        )
+        return out
+
+    def closeall(self):
+        self._pool.closeall()
 
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_scoped_conn = ContextVar("scoped_db_conn", default=None)
+
+
+def get_pool() -> ConnectionPool:
+    """Process-wide pool, created lazily (and re-created after a fork)."""
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ConnectionPool(
+                Config.DB_POOL_MIN,
+                Config.DB_POOL_MAX,
+                Config.DB_POOL_TIMEOUT_SECONDS,
+                Config.DB_POOL_HEALTHCHECK_SECONDS,
+                **_db_config(),
+            )
+            _pool_pid = os.getpid()
+    return _pool
+
+
+def pool_stats():
+    """Checkout/wait statistics of the process pool ({} if not created yet)."""
+    if _pool is None or _pool_pid != os.getpid():
+        return {}
+    return _pool.stats()
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+
+
+@contextmanager
+def connection_scope():
+    """
+    Pin one pooled connection to the current context (a tool call, an ingested
+    file, ...).
+
+    Every get_db_connection() inside the scope reuses it instead of checking
+    out its own, so a unit of work costs one checkout. The connection is held
+    for the whole scope, so don't wrap slow non-DB work (OpenAI calls) in one.
+    Nested scopes are no-ops.
+    """
+    conn = _scoped_conn.get()
+    if conn is not None:
+        yield conn
+        return
+    p = get_pool()
+    conn = p.getconn()
+    token = _scoped_conn.set(conn)
+    try:
+        yield conn
+    finally:
+        _scoped_conn.reset(token)
+        p.putconn(conn)
+
+
+@contextmanager
+def get_db_connection():
+    """
+    Yield a pooled psycopg2 connection (the scoped one if inside connection_scope()).
+
+    On success: COMMIT.
+    On errors: ROLLBACK.
+    The connection is always returned to the pool.
+    """
+    conn = _scoped_conn.get()
+    owned = conn is None
+    if owned:
+        conn = get_pool().getconn()
+    try:
         yield conn
         conn.commit()
-    except psycopg2.Error:
-        if conn:
+    except Exception:
+        if not conn.closed:
             conn.rollback()
         raise
     finally:
-        if conn:
-            conn.close()
+        if owned:
+            get_pool().putconn(conn)
@@ -0,0 +1,258 @@
+"""
+Minimal Prometheus-style metrics (text exposition format, no extra dependency).
+
+    with timed("openai_chat"):
+        ...
+    record_usage(model, resp.get("usage"))
+
+Every timed() stage also lands in the current request's Breakdown (see
+request_breakdown()), which /ask can return for debugging.
+"""
+import threading, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(v):
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _fmt_value(v):
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = [(k, (list(c), s, n)) for k, (c, s, n) in self._values.items()]
+        lines = self.header()
+        for key, (counts, total, n) in items:
+            for b, c in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, [('le', _fmt_value(b))])} {c}")
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, [('le', '+Inf')])} {n}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_value(total)}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, prefix, fn):
+        """Expose a stats dict (e.g. db.pool_stats) as gauges `<prefix>_<key>` at scrape time."""
+        self._collectors.append((prefix, fn))
+
+    def render(self):
+        lines = []
+        for m in self._metrics:
+            lines += m.render()
+        for prefix, fn in self._collectors:
+            try:
+                stats = fn() or {}
+            except Exception:
+                continue
+            for k, v in stats.items():
+                if isinstance(v, bool) or not isinstance(v, (int, float)):
+                    continue
+                lines += [f"# TYPE {prefix}_{k} gauge", f"{prefix}_{k} {_fmt_value(v)}"]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "rag_stage_seconds", "Latency of instrumented stages (OpenAI, embeddings, tools, DB, ingestion).", ["stage"]))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "rag_stage_errors_total", "Instrumented stages that raised.", ["stage"]))
+TOKENS = REGISTRY.register(Counter(
+    "rag_openai_tokens_total", "OpenAI tokens used.", ["model", "kind"]))
+REQUESTS = REGISTRY.register(Counter(
+    "rag_requests_total", "/ask requests by outcome.", ["mode", "status"]))
+REQUEST_TOKENS = REGISTRY.register(Histogram(
+    "rag_request_tokens", "OpenAI tokens used per /ask request.", (),
+    buckets=(500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)))
+
+
+class Breakdown:
+    """Per-request stage timings and token usage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.tokens = {"prompt": 0, "completion": 0}
+        self.started = time.perf_counter()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            s = self.stages.setdefault(stage, {"count": 0, "seconds": 0.0})
+            s["count"] += 1
+            s["seconds"] += seconds
+
+    def add_tokens(self, kind, n):
+        with self._lock:
+            self.tokens[kind] = self.tokens.get(kind, 0) + n
+
+    @property
+    def total_tokens(self):
+        return sum(self.tokens.values())
+
+    def as_dict(self):
+        with self._lock:
+            stages = {k: {"count": v["count"], "ms": round(v["seconds"] * 1000, 2)} for k, v in self.stages.items()}
+            return {"total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+                    "stages": stages, "tokens": dict(self.tokens)}
+
+
+_breakdown = ContextVar("request_breakdown", default=None)
+
+
+def current_breakdown():
+    return _breakdown.get()
+
+
+@contextmanager
+def bind_breakdown(breakdown):
+    """Attach an existing Breakdown in another thread (e.g. a tool worker)."""
+    token = _breakdown.set(breakdown)
+    try:
+        yield breakdown
+    finally:
+        _breakdown.reset(token)
+
+
+@contextmanager
+def request_breakdown():
+    with bind_breakdown(Breakdown()) as b:
+        yield b
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    b = _breakdown.get()
+    if b is not None:
+        b.add(stage, seconds)
+
+
+@contextmanager
+def timed(stage):
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - t0)
+
+
+def timed_fn(stage):
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def record_usage(model, usage):
+    """Count an OpenAI `usage` object (chat or embeddings) globally and for the current request."""
+    if not usage:
+        return
+    b = _breakdown.get()
+    for kind, field in (("prompt", "prompt_tokens"), ("completion", "completion_tokens")):
+        n = usage.get(field) or 0
+        if n:
+            TOKENS.inc(n, model=model, kind=kind)
+            if b is not None:
+                b.add_tokens(kind, n)
+
+
+def render():
+    return REGISTRY.render()
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def start_http_server(port, host="0.0.0.0"):
+    """Serve /metrics from a daemon thread (for processes without Flask, e.g. the Drive poller)."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
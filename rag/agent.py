@@ -1,19 +1,29 @@
-import json, requests
+import asyncio, contextvars, functools, hashlib, json, math, operator, threading, time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from config import Config
-from db import get_db_connection
+from db import connection_scope, get_db_connection
+from metrics import bind_breakdown, current_breakdown, observe_stage, record_usage, timed
+from .cache import TTLCache
+from .embeddings import count_tokens, embed_texts
+from . import openai_client
+
+try:
+    import numpy as np
+except ImportError:  # optional: the semantic answer-cache scan falls back to pure Python
+    np = None
 
 SYSTEM_PROMPT = """You are a helpful assistant for questions about documents (text or tabular).
 Tools you can call:
-1) rag_search(query)
+1) rag_search(query) - returns diverse passages with file_id and offset; read around a passage with get_file_contents(file_id, offset)
 2) list_documents()
-3) get_file_contents(file_id)
-4) query_document_rows(sql_query)
+3) get_file_contents(file_id, offset, max_chars) - pages through long documents; follow next_offset only if needed
+4) query_document_rows(sql_query) - prefer the typed dataset_table listed by list_documents (real typed, indexed columns) over casting document_rows.row_data JSON
 Start with RAG unless SQL is clearly required. Do not fabricate.
 """
 
 TOOLS = [
     {"type":"function","function":{
-        "name":"rag_search", "description":"RAG search using vector similarity",
+        "name":"rag_search", "description":"Search the documents; returns the most relevant, non-overlapping passages",
         "parameters":{"type":"object","properties":{"query":{"type":"string"}},"required":["query"]}
     }},
     {"type":"function","function":{
@@ -21,40 +31,487 @@ TOOLS = [
         "parameters":{"type":"object","properties":{}}
     }},
     {"type":"function","function":{
-        "name":"get_file_contents","description":"Get merged text of a document",
-        "parameters":{"type":"object","properties":{"file_id":{"type":"string"}},"required":["file_id"]}
+        "name":"get_file_contents","description":"Get a page of a document's text (returns text and next_offset)",
+        "parameters":{"type":"object","properties":{
+            "file_id":{"type":"string"},
+            "offset":{"type":"integer","description":"character offset to start from (default 0)"},
+            "max_chars":{"type":"integer","description":"page size in characters (default 6000)"}},
+            "required":["file_id"]}
     }},
     {"type":"function","function":{
-        "name":"query_document_rows","description":"Run SELECT over document_rows",
+        "name":"query_document_rows","description":"Run SELECT over a typed dataset table (ds_*) or document_rows",
         "parameters":{"type":"object","properties":{"sql_query":{"type":"string"}},"required":["sql_query"]}
     }},
 ]
 
-def _openai_chat(messages, tools=None):
-    headers = {"Authorization": f"Bearer {Config.OPENAI_API_KEY}"}
-    payload = {"model": "gpt-4o-mini", "messages": messages, "temperature": 0.2}
+def _chat_payload(messages, tools=None):
+    payload = {"model": Config.CHAT_MODEL, "messages": messages, "temperature": 0.2}
     if tools:
         payload["tools"] = tools
         payload["tool_choice"] = "auto"
-    r = requests.post("https://api.openai.com/v1/chat/completions", json=payload, headers=headers, timeout=120)
-    r.raise_for_status()
-    return r.json()
+    return payload
+
+def _openai_chat(messages, tools=None):
+    with timed("openai_chat"):
+        body = openai_client.post("/chat/completions", _chat_payload(messages, tools)).json()
+    record_usage(Config.CHAT_MODEL, body.get("usage"))
+    return body
+
+def _stream_payload(messages, tools=None):
+    return dict(_chat_payload(messages, tools), stream=True, stream_options={"include_usage": True})
+
+class _StreamedMessage:
+    """
+    Assembles a streamed chat completion from its SSE lines: content deltas
+    and tool_calls, which the API streams in fragments keyed by index.
+    """
+
+    def __init__(self):
+        self.content, self.calls, self.done = [], {}, False
+
+    def feed(self, line):
+        """Consume one SSE line; returns the content delta it carried (or None)."""
+        if not line or not line.startswith("data:"):
+            return None
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            self.done = True
+            return None
+        chunk = json.loads(data)
+        record_usage(Config.CHAT_MODEL, chunk.get("usage"))
+        choices = chunk.get("choices") or []
+        if not choices:
+            return None
+        delta = choices[0].get("delta") or {}
+        for tc in delta.get("tool_calls") or []:
+            call = self.calls.setdefault(tc["index"], {"id": None, "type": "function",
+                                                       "function": {"name": "", "arguments": ""}})
+            if tc.get("id"):
+                call["id"] = tc["id"]
+            fn = tc.get("function") or {}
+            call["function"]["name"] += fn.get("name") or ""
+            call["function"]["arguments"] += fn.get("arguments") or ""
+        if delta.get("content"):
+            self.content.append(delta["content"])
+            return delta["content"]
+        return None
+
+    def message(self):
+        msg = {"role": "assistant", "content": "".join(self.content) or None}
+        if self.calls:
+            msg["tool_calls"] = [self.calls[i] for i in sorted(self.calls)]
+        return msg
+
+def _openai_chat_stream(messages, tools=None):
+    """
+    Streaming chat completion. Yields ("token", text) for content deltas as they
+    arrive, then ("message", msg) with the assembled assistant message.
+    """
+    acc, started = _StreamedMessage(), time.perf_counter()
+    with openai_client.post("/chat/completions", _stream_payload(messages, tools), stream=True) as r:
+        for line in r.iter_lines(decode_unicode=True):
+            text = acc.feed(line)
+            if text:
+                yield "token", text
+            if acc.done:
+                break
+    observe_stage("openai_chat_stream", time.perf_counter() - started)
+    yield "message", acc.message()
 
-def _save_message(session_id, role, content):
+async def _aopenai_chat(messages, tools=None):
+    with timed("openai_chat"):
+        body = await openai_client.apost("/chat/completions", _chat_payload(messages, tools))
+    record_usage(Config.CHAT_MODEL, body.get("usage"))
+    return body
+
+async def _aopenai_chat_stream(messages, tools=None):
+    """Async twin of _openai_chat_stream."""
+    acc, started = _StreamedMessage(), time.perf_counter()
+    async with openai_client.astream("/chat/completions", _stream_payload(messages, tools)) as r:
+        async for line in r.aiter_lines():
+            text = acc.feed(line)
+            if text:
+                yield "token", text
+            if acc.done:
+                break
+    observe_stage("openai_chat_stream", time.perf_counter() - started)
+    yield "message", acc.message()
+
+# session_id -> (id of the newest message, messages). Entries are checked against
+# chat_messages before use, so turns written by other worker processes are never missed.
+_history_cache = TTLCache(Config.HISTORY_CACHE_SESSIONS, Config.HISTORY_CACHE_TTL_SECONDS)
+
+_LATEST_MESSAGE = """SELECT id FROM chat_messages WHERE session_id=%s
+                     ORDER BY created_at DESC, id DESC LIMIT 1"""
+
+def _save_turn(session_id, user_text, answer):
+    """
+    Persist a user/assistant exchange in one statement. The session's cached
+    history is extended only if it still ended at the message just before
+    this turn (no other worker wrote in between); otherwise it is dropped.
+    """
     with get_db_connection() as conn, conn.cursor() as cur:
-        cur.execute("INSERT INTO chat_messages (session_id, role, content) VALUES (%s,%s,%s)", (session_id, role, content))
+        # clock_timestamp() (not NOW()) keeps the two rows strictly ordered by created_at.
+        # All parts of the statement share one snapshot: prev is the newest message before this turn.
+        cur.execute(f"""WITH prev AS ({_LATEST_MESSAGE}),
+                             ins AS (INSERT INTO chat_messages (session_id, role, content, created_at)
+                                     VALUES (%s,'user',%s,clock_timestamp()), (%s,'assistant',%s,clock_timestamp())
+                                     RETURNING id)
+                        SELECT (SELECT id FROM prev), (SELECT max(id) FROM ins)""",
+                    (session_id, session_id, user_text, session_id, answer))
+        prev_id, last_id = cur.fetchone()
         conn.commit()
+    cached = _history_cache.get(session_id)
+    if cached is None:
+        return
+    if cached[0] == prev_id:
+        turn = [{"role": "user", "content": user_text}, {"role": "assistant", "content": answer}]
+        _history_cache.put(session_id, (last_id, (cached[1] + turn)[-Config.HISTORY_MAX_MESSAGES:]))
+    else:
+        _history_cache.pop(session_id)
 
-def _history(session_id, limit=8):
+def _recent_messages(session_id):
+    """
+    Newest HISTORY_MAX_MESSAGES messages of a session (oldest first). The
+    cached copy is used only while its newest message is still the session's
+    newest (one index lookup); otherwise the messages are re-read.
+    """
+    cached = _history_cache.get(session_id)
     with get_db_connection() as conn, conn.cursor() as cur:
-        cur.execute("""SELECT role, content FROM chat_messages
-                       WHERE session_id=%s ORDER BY created_at DESC LIMIT %s""", (session_id, limit))
+        if cached is not None:
+            cur.execute(_LATEST_MESSAGE, (session_id,))
+            row = cur.fetchone()
+            if (row[0] if row else None) == cached[0]:
+                return cached[1]
+        cur.execute("""SELECT id, role, content FROM chat_messages
+                       WHERE session_id=%s ORDER BY created_at DESC, id DESC LIMIT %s""",
+                    (session_id, Config.HISTORY_MAX_MESSAGES))
         rows = cur.fetchall()
-    return [{"role": r[0], "content": r[1]} for r in reversed(rows)]
+    msgs = [{"role": r[1], "content": r[2]} for r in reversed(rows)]
+    _history_cache.put(session_id, (rows[0][0] if rows else None, msgs))
+    return msgs
+
+def _compact(content, chars):
+    return content if len(content) <= chars else content[:chars].rstrip() + " …"
+
+def _history(session_id, token_budget=None):
+    """
+    Most recent history that fits `token_budget` (default HISTORY_TOKEN_BUDGET).
+
+    Walks back from the newest message: messages are kept verbatim while they
+    fit; older/longer ones are compacted to HISTORY_COMPACT_CHARS, and
+    selection stops at the first message that does not fit even compacted.
+    """
+    budget = Config.HISTORY_TOKEN_BUDGET if token_budget is None else token_budget
+    picked = []
+    for m in reversed(_recent_messages(session_id)):
+        content = m["content"] or ""
+        cost = count_tokens(content)
+        if cost > budget:
+            content = _compact(content, Config.HISTORY_COMPACT_CHARS)
+            cost = count_tokens(content)
+            if cost > budget:
+                break
+        picked.append({"role": m["role"], "content": content})
+        budget -= cost
+    return list(reversed(picked))
+
+def _call_tool(tools_impl, name, args):
+    if name == "rag_search":
+        return tools_impl.tool_rag_search(args["query"])
+    elif name == "list_documents":
+        return tools_impl.tool_list_documents()
+    elif name == "get_file_contents":
+        # Pages larger than FILE_CONTENTS_PAGE_CHARS would be cut by the 8000-char tool message limit.
+        max_chars = min(int(args.get("max_chars") or Config.FILE_CONTENTS_PAGE_CHARS), Config.FILE_CONTENTS_PAGE_CHARS)
+        return tools_impl.tool_get_file_contents(args["file_id"], args.get("offset", 0), max_chars)
+    elif name == "query_document_rows":
+        return tools_impl.tool_query_document_rows(args["sql_query"])
+    return {"error": f"unknown tool {name}"}
+
+_tool_executor = None
+_tool_executor_lock = threading.Lock()
+_tool_conns_lock = threading.Lock()
+
+def tool_workers():
+    """
+    TOOL_MAX_WORKERS capped at half of DB_POOL_MAX: each worker holds its own
+    pooled connection for the length of a call, and the other half stays free
+    for the requests' short checkouts (history, answer cache, saving the turn),
+    which never hold a connection across an OpenAI wait.
+    """
+    return max(1, min(Config.TOOL_MAX_WORKERS, Config.DB_POOL_MAX // 2))
+
+def _get_tool_executor():
+    global _tool_executor
+    with _tool_executor_lock:
+        if _tool_executor is None:
+            _tool_executor = ThreadPoolExecutor(max_workers=tool_workers(), thread_name_prefix="agent-tool")
+        return _tool_executor
+
+def _safe_call_tool(tools_impl, name, args):
+    try:
+        return _call_tool(tools_impl, name, args)
+    except Exception as e:
+        return {"error": f"{name} failed: {e}"}
+
+def _submit_tools(tools_impl, calls):
+    """Parse one turn's tool calls and submit the valid ones; returns [(call, name, args, future, slot)]."""
+    ex = _get_tool_executor()
+    breakdown = current_breakdown()
+
+    def run(name, args, slot):
+        # Workers don't inherit contextvars, so only the request's timing breakdown
+        # is carried over; the call's queries share one checkout.
+        with bind_breakdown(breakdown), connection_scope() as conn:
+            with _tool_conns_lock:
+                if slot.get("abandoned"):
+                    return None
+                slot["conn"] = conn
+            try:
+                return _safe_call_tool(tools_impl, name, args)
+            finally:
+                # Cleared before the connection goes back to the pool, so a late
+                # cancel() can never hit another request's query.
+                with _tool_conns_lock:
+                    slot["conn"] = None
+
+    submitted = []
+    for call in calls:
+        name = call["function"]["name"]
+        try:
+            args = json.loads(call["function"]["arguments"] or "{}")
+        except ValueError as e:
+            args = {"_invalid": str(e)}
+        slot = {}
+        fut = None if "_invalid" in args else ex.submit(run, name, args, slot)
+        submitted.append((call, name, args, fut, slot))
+    return submitted
+
+def _invalid_args(args):
+    return {"error": f"invalid JSON arguments: {args['_invalid']}"}
+
+def _abandon(name, fut, slot):
+    """Give up on a timed-out call: a queued one never starts, a running one has its query cancelled."""
+    fut.cancel()
+    with _tool_conns_lock:
+        slot["abandoned"] = True
+        if slot.get("conn") is not None:
+            slot["conn"].cancel()
+    return {"error": f"{name} timed out after {Config.TOOL_TIMEOUT_SECONDS}s"}
+
+def _run_tools(tools_impl, calls):
+    """
+    Execute one turn's tool calls; returns [(call, name, out)] in the original order.
+
+    Every call, a lone one included, runs on a bounded executor (see
+    tool_workers) with its own pooled connection, so several calls run
+    concurrently; a call exceeding TOOL_TIMEOUT_SECONDS or raising becomes an
+    error result for the model instead of failing the request. On a timeout
+    the call's running query is cancelled, so the worker and its connection
+    are released instead of running on in the background.
+    """
+    deadline = time.monotonic() + Config.TOOL_TIMEOUT_SECONDS
+    results = []
+    for call, name, args, fut, slot in _submit_tools(tools_impl, calls):
+        if fut is None:
+            out = _invalid_args(args)
+        else:
+            try:
+                out = fut.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeout:
+                out = _abandon(name, fut, slot)
+        results.append((call, name, out))
+    return results
+
+async def _arun_tools(tools_impl, calls):
+    """_run_tools for the asyncio agent: the tool futures are awaited, so no thread waits on them."""
+    deadline = time.monotonic() + Config.TOOL_TIMEOUT_SECONDS
+    results = []
+    for call, name, args, fut, slot in _submit_tools(tools_impl, calls):
+        if fut is None:
+            out = _invalid_args(args)
+        elif fut.done():  # finished while an earlier call was awaited
+            out = fut.result()
+        else:
+            try:
+                out = await asyncio.wait_for(asyncio.wrap_future(fut), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                out = _abandon(name, fut, slot)
+        results.append((call, name, out))
+    return results
+
+_db_executor = None
+
+def _get_db_executor():
+    """Threads for the asyncio agent's blocking DB work, one per pool connection (not the loop's default executor)."""
+    global _db_executor
+    with _tool_executor_lock:
+        if _db_executor is None:
+            _db_executor = ThreadPoolExecutor(max_workers=max(1, Config.DB_POOL_MAX), thread_name_prefix="agent-db")
+        return _db_executor
+
+async def _blocking(fn, *args):
+    """Run fn(*args) on the DB executor with the caller's contextvars (timing breakdown)."""
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_get_db_executor(), functools.partial(ctx.run, fn, *args))
+
+TOOL_MESSAGE_MAX_CHARS = 8000
+
+def _dumps(out):
+    return json.dumps(out, ensure_ascii=False, default=str)
+
+def _fit_json(out, limit=TOOL_MESSAGE_MAX_CHARS):
+    """
+    Serialize a tool result within `limit` chars, dropping whole trailing
+    items (of a list, or of a {"rows": [...]} result) so the model always
+    gets valid JSON; anything else is cut as a last resort.
+    """
+    text = _dumps(out)
+    if len(text) <= limit:
+        return text
+    items = out if isinstance(out, list) else out.get("rows") if isinstance(out, dict) else None
+    if isinstance(items, list):
+        n = len(items)
+        while n > 0:
+            n = min(n - 1, int(n * limit / len(text)))
+            trimmed = items[:n] if isinstance(out, list) else dict(out, rows=items[:n], truncated=True)
+            text = _dumps(trimmed)
+            if len(text) <= limit:
+                return text
+    return text[:limit]
+
+def _tool_message(call, name, out):
+    return {
+        "role":"tool",
+        "tool_call_id": call["id"],
+        "name": name,
+        "content": _fit_json(out),
+    }
+
+_answer_cache = TTLCache(Config.ANSWER_CACHE_SIZE, Config.ANSWER_CACHE_TTL_SECONDS)
+_answer_stats = {"hits": 0, "semantic_hits": 0, "misses": 0}
+_answer_stats_lock = threading.Lock()
+# Query vectors of one scope (model, version, history digest) as a matrix, rebuilt after puts.
+_semantic = {"puts": 0, "built": -1, "scope": None, "keys": [], "matrix": None}
+
+def _count_answer(name):
+    with _answer_stats_lock:
+        _answer_stats[name] += 1
+
+def answer_cache_stats():
+    with _answer_stats_lock:
+        out = dict(_answer_stats)
+    out["enabled"], out["size"] = Config.ANSWER_CACHE, len(_answer_cache)
+    return out
+
+def _normalize_question(text):
+    return " ".join(text.lower().split()).rstrip(" ?!.")
+
+def _corpus_version():
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT version FROM corpus_state")
+        row = cur.fetchone()
+    return row[0] if row else 0
+
+def _unit(vec):
+    if np is not None:
+        v = np.asarray(vec, dtype=np.float32)
+        return v / (np.linalg.norm(v) or 1.0)
+    norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+    return [x / norm for x in vec]
+
+def _semantic_match(scope, vec, threshold):
+    """
+    Answer of the most similar cached question in `scope` with cosine >= threshold.
+
+    With NumPy the scope's vectors are kept as one float32 matrix (rebuilt
+    only after new answers are stored), so a miss costs one matrix-vector
+    product. Without it the scan is pure Python: about ANSWER_CACHE_SIZE x
+    dimensions multiplications (~0.8M, tens of ms) per miss.
+    """
+    if np is None:
+        best, best_sim = None, threshold
+        for (model, version, digest, _), (answer, other) in _answer_cache.items():
+            if (model, version, digest) != scope or other is None:
+                continue
+            sim = sum(map(operator.mul, vec, other))
+            if sim >= best_sim:
+                best, best_sim = answer, sim
+        return best
+    with _answer_stats_lock:
+        if _semantic["built"] != _semantic["puts"] or _semantic["scope"] != scope:
+            entries = [(k, other) for k, (_, other) in _answer_cache.items() if k[:3] == scope and other is not None]
+            _semantic.update(built=_semantic["puts"], scope=scope, keys=[k for k, _ in entries],
+                             matrix=np.vstack([o for _, o in entries]) if entries else None)
+        keys, matrix = _semantic["keys"], _semantic["matrix"]
+    if matrix is None:
+        return None
+    sims = matrix @ vec
+    for i in np.argsort(-sims):
+        if sims[i] < threshold:
+            break
+        hit = _answer_cache.get(keys[i])  # None once expired or evicted since the matrix was built
+        if hit is not None:
+            return hit[0]
+    return None
+
+def _history_digest(history):
+    """Digest of the prior turns the model sees ("" for a conversation's first question)."""
+    if not history:
+        return ""
+    return hashlib.sha256(_dumps([[m["role"], m["content"]] for m in history]).encode("utf-8")).hexdigest()
+
+def _cached_answer(user_text, history):
+    """
+    Opt-in (ANSWER_CACHE) lookup keyed on (CHAT_MODEL, corpus version, digest
+    of `history`, normalized question), so a follow-up like "and the second
+    one?" only matches the same conversation.
+
+    Returns (answer, None) on a hit, else (None, slot) where slot is passed to
+    _store_answer once the agent has answered. With
+    ANSWER_CACHE_SEMANTIC_THRESHOLD > 0, a miss also reuses the answer of the
+    most similar cached question (cosine of query embeddings) above it with
+    the same history.
+    Entries from older corpus versions are never matched and simply age out.
+    """
+    if not Config.ANSWER_CACHE:
+        return None, None
+    key = (Config.CHAT_MODEL, _corpus_version(), _history_digest(history), _normalize_question(user_text))
+    hit = _answer_cache.get(key)
+    if hit is not None:
+        _count_answer("hits")
+        return hit[0], None
+
+    vec = None
+    threshold = Config.ANSWER_CACHE_SEMANTIC_THRESHOLD
+    if threshold > 0:
+        vec = _unit(embed_texts([user_text])[0])
+        best = _semantic_match(key[:3], vec, threshold)
+        if best is not None:
+            _count_answer("semantic_hits")
+            return best, None
+    _count_answer("misses")
+    return None, (key, vec)
+
+def _store_answer(slot, answer):
+    if slot is not None and answer:
+        key, vec = slot
+        _answer_cache.put(key, (answer, vec))
+        with _answer_stats_lock:
+            _semantic["puts"] += 1
+
+def _initial_messages(history, user_text):
+    return [{"role":"system","content":SYSTEM_PROMPT}] + history + [{"role":"user","content":user_text}]
 
 def run_agent(session_id: str, user_text: str, tools_impl):
-    messages = [{"role":"system","content":SYSTEM_PROMPT}] + _history(session_id, 8)
-    messages.append({"role":"user","content":user_text})
+    history = _history(session_id)
+    cached, slot = _cached_answer(user_text, history)
+    if cached is not None:
+        _save_turn(session_id, user_text, cached)
+        return cached
+
+    messages = _initial_messages(history, user_text)
 
     resp = _openai_chat(messages, tools=TOOLS)
     msg = resp["choices"][0]["message"]
@@ -62,33 +519,115 @@ def run_agent(session_id: str, user_text: str, tools_impl):
     while True:
         if "tool_calls" not in msg:
             final = msg.get("content", "")
-            _save_message(session_id, "user", user_text)
-            _save_message(session_id, "assistant", final)
+            _save_turn(session_id, user_text, final)
+            _store_answer(slot, final)
             return final
 
-        tool_msgs = []
+        messages.append(msg)
+        messages += [_tool_message(call, name, out) for call, name, out in _run_tools(tools_impl, msg["tool_calls"])]
+        msg = _openai_chat(messages, tools=TOOLS)["choices"][0]["message"]
+
+def run_agent_stream(session_id: str, user_text: str, tools_impl):
+    """
+    Streaming variant of run_agent. Yields (event, data) pairs:
+    ("tool_call", {name, arguments}), ("tool_result", {name, chars}),
+    ("token", {content}) for each answer delta and finally ("done", {answer}).
+    The completed exchange is persisted exactly like run_agent.
+    """
+    history = _history(session_id)
+    cached, slot = _cached_answer(user_text, history)
+    if cached is not None:
+        _save_turn(session_id, user_text, cached)
+        yield "token", {"content": cached}
+        yield "done", {"answer": cached, "cached": True}
+        return
+
+    messages = _initial_messages(history, user_text)
+
+    while True:
+        msg = None
+        for kind, value in _openai_chat_stream(messages, tools=TOOLS):
+            if kind == "token":
+                yield "token", {"content": value}
+            else:
+                msg = value
+
+        if not msg.get("tool_calls"):
+            final = msg.get("content") or ""
+            _save_turn(session_id, user_text, final)
+            _store_answer(slot, final)
+            yield "done", {"answer": final}
+            return
+
+        messages.append(msg)
         for call in msg["tool_calls"]:
-            name = call["function"]["name"]
-            args = json.loads(call["function"]["arguments"] or "{}")
+            yield "tool_call", {"name": call["function"]["name"], "arguments": call["function"]["arguments"]}
+        for call, name, out in _run_tools(tools_impl, msg["tool_calls"]):
+            tool_msg = _tool_message(call, name, out)
+            messages.append(tool_msg)
+            yield "tool_result", {"name": name, "chars": len(tool_msg["content"]),
+                                  "error": isinstance(out, dict) and "error" in out}
+
+async def run_agent_async(session_id: str, user_text: str, tools_impl):
+    """
+    asyncio twin of run_agent (served by asgi.py). OpenAI calls await the shared
+    keep-alive client, so a conversation waiting on the model holds no thread;
+    DB work (blocking psycopg2) runs on a dedicated executor sized to
+    DB_POOL_MAX, each step with a short pooled checkout, and tool calls are
+    awaited on the tool executor without blocking a thread.
+    """
+    history = await _blocking(_history, session_id)
+    cached, slot = await _blocking(_cached_answer, user_text, history)
+    if cached is not None:
+        await _blocking(_save_turn, session_id, user_text, cached)
+        return cached
 
-            if name == "rag_search":
-                out = tools_impl.rag_search(args["query"])
-            elif name == "list_documents":
-                out = tools_impl.tool_list_documents()
-            elif name == "get_file_contents":
-                out = tools_impl.tool_get_file_contents(args["file_id"])
-            elif name == "query_document_rows":
-                out = tools_impl.tool_query_document_rows(args["sql_query"])
+    messages = _initial_messages(history, user_text)
+    msg = (await _aopenai_chat(messages, tools=TOOLS))["choices"][0]["message"]
+
+    while "tool_calls" in msg:
+        messages.append(msg)
+        results = await _arun_tools(tools_impl, msg["tool_calls"])
+        messages += [_tool_message(call, name, out) for call, name, out in results]
+        msg = (await _aopenai_chat(messages, tools=TOOLS))["choices"][0]["message"]
+
+    final = msg.get("content", "")
+    await _blocking(_save_turn, session_id, user_text, final)
+    _store_answer(slot, final)
+    return final
+
+async def run_agent_stream_async(session_id: str, user_text: str, tools_impl):
+    """asyncio twin of run_agent_stream (same events)."""
+    history = await _blocking(_history, session_id)
+    cached, slot = await _blocking(_cached_answer, user_text, history)
+    if cached is not None:
+        await _blocking(_save_turn, session_id, user_text, cached)
+        yield "token", {"content": cached}
+        yield "done", {"answer": cached, "cached": True}
+        return
+
+    messages = _initial_messages(history, user_text)
+
+    while True:
+        msg = None
+        async for kind, value in _aopenai_chat_stream(messages, tools=TOOLS):
+            if kind == "token":
+                yield "token", {"content": value}
             else:
-                out = {"error": f"unknown tool {name}"}
+                msg = value
 
-            tool_msgs.append({
-                "role":"tool",
-                "tool_call_id": call["id"],
-                "name": name,
-                "content": json.dumps(out, ensure_ascii=False)[:8000],
-            })
+        if not msg.get("tool_calls"):
+            final = msg.get("content") or ""
+            await _blocking(_save_turn, session_id, user_text, final)
+            _store_answer(slot, final)
+            yield "done", {"answer": final}
+            return
 
         messages.append(msg)
-        messages += tool_msgs
-        msg = _openai_chat(messages, tools=TOOLS)["choices"][0]["message"]
+        for call in msg["tool_calls"]:
+            yield "tool_call", {"name": call["function"]["name"], "arguments": call["function"]["arguments"]}
+        for call, name, out in await _arun_tools(tools_impl, msg["tool_calls"]):
+            tool_msg = _tool_message(call, name, out)
+            messages.append(tool_msg)
+            yield "tool_result", {"name": name, "chars": len(tool_msg["content"]),
+                                  "error": isinstance(out, dict) and "error" in out}
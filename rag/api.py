@@ -1,14 +1,53 @@
-from flask import Blueprint, request, jsonify, current_app
+import json
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 import requests
 from config import Config
-from .agent import run_agent
+from metrics import REQUESTS, REQUEST_TOKENS, request_breakdown
+from .agent import run_agent, run_agent_stream
 from . import tools as tools_impl
 
 rag_bp = Blueprint("rag", __name__)
 
 @rag_bp.route("/ask", methods=["GET"])
 def ask_get():
-    return jsonify({"ok": True, "hint": "Use POST with JSON {message, sessionId} and x-api-key header"}), 200
+    return jsonify({"ok": True, "hint": "Use POST with JSON {message, sessionId[, stream]} and x-api-key header"}), 200
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+def _debug_timings(data, headers):
+    return bool(data.get("debug")) or headers.get("x-debug-timings", "").lower() in ("1", "true", "yes")
+
+def _finish(b, mode, status):
+    REQUESTS.inc(mode=mode, status=status)
+    if b.total_tokens:
+        REQUEST_TOKENS.observe(b.total_tokens)
+
+def _sse_response(session_id, message, debug=False):
+    """Server-sent events: tool progress, answer tokens, then `done` (or `error`)."""
+    logger = current_app.logger
+
+    def events():
+        status = "ok"
+        with request_breakdown() as b:
+            try:
+                for event, data in run_agent_stream(session_id=session_id, user_text=message, tools_impl=tools_impl):
+                    if event == "done" and debug:
+                        data = dict(data, timings=b.as_dict())
+                    yield _sse(event, data)
+            except requests.HTTPError as e:
+                status = "openai_http"
+                txt = getattr(e.response, "text", "") or str(e)
+                yield _sse("error", {"error":"openai_http", "status": getattr(e.response, "status_code", None), "detail": txt[:400]})
+            except Exception as e:
+                status = "internal"
+                logger.exception("rag /ask stream failed")
+                yield _sse("error", {"error":"internal", "detail": str(e)[:200]})
+            finally:
+                _finish(b, "sse", status)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers=headers)
 
 @rag_bp.route("/ask", methods=["POST"])
 def ask_post():
@@ -24,12 +63,30 @@ def ask_post():
         if not Config.OPENAI_API_KEY:
             return jsonify({"error": "OPENAI_API_KEY missing"}), 500
 
-        answer = run_agent(session_id=session_id, user_text=message, tools_impl=tools_impl)
-        return jsonify({"answer": answer})
-
-    except requests.HTTPError as e:
-        txt = getattr(e.response, "text", "") or str(e)
-        return jsonify({"error":"openai_http", "status": getattr(e.response, "status_code", None), "detail": txt[:400]}), 502
+        if data.get("stream") or "text/event-stream" in request.headers.get("Accept", ""):
+            return _sse_response(session_id, message, debug=_debug_timings(data, request.headers))
     except Exception as e:
         current_app.logger.exception("rag /ask failed")
         return jsonify({"error":"internal", "detail": str(e)[:200]}), 500
+
+    status = "ok"
+    with request_breakdown() as b:
+        try:
+            # No request-wide connection_scope(): history, cache and saves take short
+            # checkouts, so no connection is held across OpenAI waits, and tool calls
+            # use their own (see rag.agent.tool_workers).
+            answer = run_agent(session_id=session_id, user_text=message, tools_impl=tools_impl)
+            out = {"answer": answer}
+            if _debug_timings(data, request.headers):
+                out["timings"] = b.as_dict()
+            return jsonify(out)
+        except requests.HTTPError as e:
+            status = "openai_http"
+            txt = getattr(e.response, "text", "") or str(e)
+            return jsonify({"error":"openai_http", "status": getattr(e.response, "status_code", None), "detail": txt[:400]}), 502
+        except Exception as e:
+            status = "internal"
+            current_app.logger.exception("rag /ask failed")
+            return jsonify({"error":"internal", "detail": str(e)[:200]}), 500
+        finally:
+            _finish(b, "json", status)
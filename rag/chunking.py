@@ -7,3 +7,22 @@ def chunk_text(text: str, size: int = 1000, overlap: int = 200):
             break
         start = max(0, end - overlap)
     return chunks
+
+def iter_chunks(pieces, size: int = 1000, overlap: int = 200):
+    """
+    Streaming chunk_text: consume text `pieces` (pages, file blocks, ...) and
+    yield the same chunks chunk_text would for their concatenation, holding
+    at most about one chunk plus one piece in memory. Overlap spans piece
+    boundaries.
+    """
+    step = max(1, size - overlap)
+    buf = ""
+    for piece in pieces:
+        buf += piece
+        pos = 0
+        while len(buf) - pos > size:
+            yield buf[pos:pos + size]
+            pos += step
+        buf = buf[pos:]
+    if buf:
+        yield buf
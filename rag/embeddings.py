@@ -1,12 +1,209 @@
-import requests
+import hashlib, logging, threading
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import execute_values
 from config import Config
+from metrics import record_usage, timed, timed_fn
+from db import get_db_connection
+from .cache import TTLCache
+from . import openai_client
 
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a chars/4 estimate
+    tiktoken = None
+
+log = logging.getLogger(__name__)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def model_key() -> str:
+    """Cache namespace: the model, plus the output size when shortened (the vectors differ)."""
+    dims = Config.EMBEDDING_DIMENSIONS
+    return f"{Config.EMBEDDING_MODEL}:{dims}" if dims else Config.EMBEDDING_MODEL
+
+
+def cache_key(text: str, model: str = None):
+    model = model or model_key()
+    digest = hashlib.sha256(_normalize(text).encode("utf-8")).hexdigest()
+    return model, digest
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache in front of the embeddings API, keyed on (model, sha256(normalized text)).
+
+    Tier 1 is an in-process LRU with TTL; tier 2 (EMBED_CACHE_DB=true) is the
+    `embedding_cache` table created by scripts/init_db.py, shared by the API
+    and the ingestion poller.
+    """
+
+    def __init__(self, maxsize: int, ttl: int, use_db: bool):
+        self.maxsize, self.use_db = maxsize, use_db
+        self._mem = TTLCache(maxsize, ttl)
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "db_errors": 0}
+
+    def _count(self, name, n):
+        with self._lock:
+            self._stats[name] += n
+
+    def get_many(self, keys):
+        """Return {key: vector} for every key found in either tier."""
+        found = {}
+        for k in keys:
+            vec = self._mem.get(k)
+            if vec is not None:
+                found[k] = vec
+        self._count("memory_hits", len(found))
+        rest = [k for k in keys if k not in found]
+        if rest and self.use_db:
+            db_found = self._db_get(rest)
+            for k, vec in db_found.items():
+                self._mem.put(k, vec)
+            self._count("db_hits", len(db_found))
+            found.update(db_found)
+        self._count("misses", len(keys) - len(found))
+        return found
+
+    def put_many(self, items):
+        for k, vec in items.items():
+            self._mem.put(k, vec)
+        if items and self.use_db:
+            self._db_put(items)
+
+    def _db_get(self, keys):
+        by_model = {}
+        for model, digest in keys:
+            by_model.setdefault(model, []).append(digest)
+        out = {}
+        try:
+            with get_db_connection() as conn, conn.cursor() as cur:
+                for model, digests in by_model.items():
+                    cur.execute("""SELECT text_hash, embedding FROM embedding_cache
+                                   WHERE model=%s AND text_hash = ANY(%s)""", (model, digests))
+                    for digest, vec in cur.fetchall():
+                        out[(model, digest)] = list(vec)
+        except Exception as e:
+            self._db_error("read", e)
+        return out
+
+    def _db_put(self, items):
+        rows = [(model, digest, vec) for (model, digest), vec in items.items()]
+        try:
+            with get_db_connection() as conn, conn.cursor() as cur:
+                execute_values(cur, """INSERT INTO embedding_cache (model, text_hash, embedding)
+                                       VALUES %s ON CONFLICT (model, text_hash) DO NOTHING""", rows)
+        except Exception as e:
+            self._db_error("write", e)
+
+    def _db_error(self, op, e):
+        self._count("db_errors", 1)
+        log.warning("embedding cache %s failed: %s", op, e)
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats, size=len(self._mem), maxsize=self.maxsize)
+        lookups = out["memory_hits"] + out["db_hits"] + out["misses"]
+        out["hit_rate"] = (out["memory_hits"] + out["db_hits"]) / lookups if lookups else 0.0
+        return out
+
+    def clear(self):
+        self._mem.clear()
+
+
+_cache = EmbeddingCache(Config.EMBED_CACHE_SIZE, Config.EMBED_CACHE_TTL_SECONDS, Config.EMBED_CACHE_DB)
+
+
+def cache_stats():
+    return _cache.stats()
+
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Token count for budgeting batches (exact with tiktoken, else ~4 chars/token)."""
+    global _encoding
+    if tiktoken is None:
+        return len(text) // 4 + 1
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.encoding_for_model(Config.EMBEDDING_MODEL)
+        except KeyError:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def token_batches(texts, max_tokens: int = None, max_inputs: int = None):
+    """Split `texts` into lists of indices that respect per-request input/token limits."""
+    max_tokens = max_tokens or Config.EMBED_BATCH_MAX_TOKENS
+    max_inputs = max_inputs or Config.EMBED_BATCH_MAX_INPUTS
+    batch, used = [], 0
+    for i, t in enumerate(texts):
+        n = count_tokens(t)
+        if batch and (used + n > max_tokens or len(batch) >= max_inputs):
+            yield batch
+            batch, used = [], 0
+        batch.append(i)
+        used += n
+    if batch:
+        yield batch
+
+
+def _embed_remote(texts):
+    with timed("openai_embeddings"):
+        payload = {"model": Config.EMBEDDING_MODEL, "input": texts}
+        if Config.EMBEDDING_DIMENSIONS:
+            payload["dimensions"] = Config.EMBEDDING_DIMENSIONS
+        r = openai_client.post("/embeddings", payload, retries=Config.EMBED_MAX_RETRIES)
+    body = r.json()
+    record_usage(Config.EMBEDDING_MODEL, body.get("usage"))
+    return [d["embedding"] for d in sorted(body["data"], key=lambda d: d["index"])]
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, Config.EMBED_MAX_WORKERS),
+                                           thread_name_prefix="embed")
+        return _executor
+
+
+def embed_batched(texts):
+    """
+    Embed any number of texts: split by token budget, run batches concurrently
+    on a bounded worker pool (with 429/5xx backoff), return vectors in input order.
+    """
+    batches = list(token_batches(texts))
+    if len(batches) <= 1:
+        return _embed_remote(list(texts)) if texts else []
+    futures = [_get_executor().submit(_embed_remote, [texts[i] for i in b]) for b in batches]
+    out = [None] * len(texts)
+    for b, fut in zip(batches, futures):
+        for i, vec in zip(b, fut.result()):
+            out[i] = vec
+    return out
+
+
+@timed_fn("embed")
 def embed_texts(texts):
-    headers = {"Authorization": f"Bearer {Config.OPENAI_API_KEY}"}
-    r = requests.post("https://api.openai.com/v1/embeddings",
-                      headers=headers,
-                      json={"model": Config.EMBEDDING_MODEL, "input": texts},
-                      timeout=60)
-    r.raise_for_status()
-    data = r.json()
-    return [d["embedding"] for d in data["data"]]
+    """Embed `texts` in order; cached vectors are reused and duplicates sent once."""
+    keys = [cache_key(t) for t in texts]
+    found = _cache.get_many(list(dict.fromkeys(keys)))
+    pending = {}
+    for k, t in zip(keys, texts):
+        if k not in found and k not in pending:
+            pending[k] = t
+    if pending:
+        fresh = dict(zip(pending, embed_batched(list(pending.values()))))
+        _cache.put_many(fresh)
+        found.update(fresh)
+    return [found[k] for k in keys]
@@ -0,0 +1,62 @@
+import hashlib
+from typing import Any, Dict, List, Tuple
+import psycopg2
+from psycopg2 import sql
+from .processors import CELL_WHITESPACE
+
+# Types ColumnTypes can infer; anything else is rejected before it reaches SQL.
+SQL_TYPES = {"bigint", "double precision", "boolean", "date", "timestamptz", "text"}
+
+
+def dataset_table(file_id: str) -> str:
+    """Stable table name for a spreadsheet's typed rows (Drive ids are case-sensitive, so hash them)."""
+    return "ds_" + hashlib.sha1(file_id.encode("utf-8")).hexdigest()[:16]
+
+
+def _create_table(cur, table: str, file_id: str, typed_schema: List[Dict[str, Any]]):
+    cols = [sql.SQL("id AS _row_id")]
+    for c in typed_schema:
+        if c["type"] not in SQL_TYPES:
+            raise ValueError(f"unsupported column type {c['type']}")
+        value = sql.SQL("NULLIF(btrim(row_data->>{}, {}), '')").format(
+            sql.Literal(c["source"]), sql.Literal(CELL_WHITESPACE))
+        if c["type"] != "text":
+            value = sql.SQL("{}::{}").format(value, sql.SQL(c["type"]))
+        cols.append(sql.SQL("{} AS {}").format(value, sql.Identifier(c["column"])))
+    cur.execute(sql.SQL("CREATE TABLE {} AS SELECT {} FROM document_rows WHERE dataset_id = {}").format(
+        sql.Identifier(table), sql.SQL(", ").join(cols), sql.Literal(file_id)))
+
+
+def materialize_dataset(cur, file_id: str, typed_schema: List[Dict[str, Any]], max_indexes: int = 16,
+                        reader_role: str = "") -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    (Re)build the typed table for one dataset from its document_rows.
+
+    Each JSON field becomes a real column of its inferred type, with a b-tree
+    index on the first `max_indexes` columns, so the agent's SQL can filter
+    and aggregate without casting through JSONB. Runs in the caller's
+    transaction, so the swap is atomic with the row rewrite. If a value still
+    fails its cast, the table is built under a savepoint again with every
+    column as text rather than failing the file. `reader_role` (SQL_READER_ROLE)
+    is granted SELECT on the new table. Returns (table, schema used).
+    """
+    table = dataset_table(file_id)
+    cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(table)))
+    cur.execute("SAVEPOINT materialize_dataset")
+    try:
+        _create_table(cur, table, file_id, typed_schema)
+    except psycopg2.DataError:
+        cur.execute("ROLLBACK TO SAVEPOINT materialize_dataset")
+        typed_schema = [dict(c, type="text") for c in typed_schema]
+        _create_table(cur, table, file_id, typed_schema)
+    cur.execute("RELEASE SAVEPOINT materialize_dataset")
+    for c in typed_schema[:max_indexes]:
+        cur.execute(sql.SQL("CREATE INDEX ON {} ({})").format(sql.Identifier(table), sql.Identifier(c["column"])))
+    if reader_role:
+        cur.execute(sql.SQL("GRANT SELECT ON {} TO {}").format(sql.Identifier(table), sql.Identifier(reader_role)))
+    cur.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(table)))
+    return table, typed_schema
+
+
+def drop_dataset(cur, file_id: str):
+    cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(dataset_table(file_id))))
@@ -1,15 +1,20 @@
-import io, json, time
+import hashlib, json, os, tempfile, threading, time
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseDownload
-from db import get_db_connection
+from db import get_db_connection, connection_scope
 from config import Config
-from .processors import (
-    extract_pdf_text, extract_google_doc_text,
-    extract_csv_rows, extract_xlsx_rows, keys_schema
-)
-from rag.chunking import chunk_text
+import metrics
+from .processors import iter_pdf_pages, iter_text_file, iter_csv_rows, keys_schema, ColumnTypes
+from .datasets import materialize_dataset, drop_dataset
+from rag.chunking import iter_chunks
 from rag.embeddings import embed_texts
+from rag import vector_mirror
+from .pipeline import Pipeline, Stage
+from .writer import DocumentSpool, copy_document_rows, update_chunk_metadata
 
 def _drive():
     creds = service_account.Credentials.from_service_account_file(
@@ -18,92 +23,538 @@ def _drive():
     )
     return build("drive", "v3", credentials=creds)
 
+def _spool(request, suffix=""):
+    """
+    Stream a Drive media request into a temp file; returns (path, md5 hexdigest).
+    Only one download chunk is held in memory at a time.
+    """
+    fh = tempfile.NamedTemporaryFile(prefix="drive-", suffix=suffix, delete=False)
+    try:
+        with fh:
+            dl = MediaIoBaseDownload(fh, request, chunksize=Config.DOWNLOAD_CHUNK_BYTES)
+            done = False
+            while not done:
+                _, done = dl.next_chunk()
+        md5 = hashlib.md5()
+        with open(fh.name, "rb") as src:
+            for block in iter(lambda: src.read(1 << 20), b""):
+                md5.update(block)
+        return fh.name, md5.hexdigest()
+    except BaseException:
+        _remove(fh.name)
+        raise
+
 def _download(service, file_id):
-    req = service.files().get_media(fileId=file_id)
-    bio = io.BytesIO()
-    dl = MediaIoBaseDownload(bio, req)
-    done = False
-    while not done:
-        _, done = dl.next_chunk()
-    bio.seek(0)
-    return bio.read()
+    return _spool(service.files().get_media(fileId=file_id))
 
 def _export(service, file_id, mime):
-    req = service.files().export_media(fileId=file_id, mimeType=mime)
-    bio = io.BytesIO()
-    dl = MediaIoBaseDownload(bio, req)
-    done = False
-    while not done:
-        _, done = dl.next_chunk()
-    bio.seek(0)
-    return bio.read()
+    return _spool(service.files().export_media(fileId=file_id, mimeType=mime))
 
-def process_file(service, f):
-    file_id, mime, title = f["id"], f["mimeType"], f["name"]
-    url = f.get("webViewLink")
+def _remove(*paths):
+    for path in paths:
+        if path:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+PDF = "application/pdf"
+GDOC = "application/vnd.google-apps.document"
+GSHEET = "application/vnd.google-apps.spreadsheet"
+EXPORT_MIME = {GDOC: "text/plain", GSHEET: "text/csv"}
+
+def _fetch(service, f):
+    """(temp path, md5) of a supported file (download or export), (None, None) otherwise."""
+    if f["mimeType"] == PDF:
+        return _download(service, f["id"])
+    if f["mimeType"] in EXPORT_MIME:
+        return _export(service, f["id"], EXPORT_MIME[f["mimeType"]])
+    return None, None
 
+def _chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _plan_chunks(file_id, title, text_path):
+    """
+    Diff the text in `text_path` against the stored chunks of file_id by chunk hash.
+
+    Chunks are streamed from the file and embedded in INGEST_BATCH_SIZE
+    batches; unchanged chunks keep their row and embedding (only
+    chunk_index/file_title are refreshed). New rows are staged in a disk-backed
+    DocumentSpool, so memory stays bounded regardless of document size. Nothing
+    is written here: the returned (stale_ids, updates, spool) are applied by
+    _apply_chunks inside the file's write transaction.
+    """
     with get_db_connection() as conn, conn.cursor() as cur:
-        cur.execute("DELETE FROM documents WHERE metadata->>'doc_id'=%s", (file_id,))
-        cur.execute("DELETE FROM document_rows WHERE dataset_id=%s", (file_id,))
+        cur.execute("SELECT id, metadata->>'chunk_hash' FROM documents WHERE metadata->>'doc_id'=%s", (file_id,))
+        existing = {}
+        for row_id, h in cur.fetchall():
+            existing.setdefault(h, []).append(row_id)
+
+    step = max(1, Config.CHUNK_SIZE - Config.CHUNK_OVERLAP)
+
+    def meta(i, h):
+        # char_start = offset of the chunk in the document (see tools.tool_get_file_contents)
+        return {"doc_id": file_id, "file_title": title, "chunk_index": i, "chunk_hash": h, "char_start": i * step}
+
+    updates, spool = [], DocumentSpool()
+    try:
+        chunks = iter_chunks(iter_text_file(text_path), Config.CHUNK_SIZE, Config.CHUNK_OVERLAP)
+        batch = list(islice(chunks, Config.INGEST_BATCH_SIZE))
+        start = 0
+        while batch:
+            fresh = []
+            for i, c in enumerate(batch, start):
+                h = _chunk_hash(c)
+                ids = existing.get(h)
+                if ids:
+                    updates.append((ids.pop(), meta(i, h)))
+                else:
+                    fresh.append((i, h, c))
+            embs = embed_texts([c for _, _, c in fresh]) if fresh else []
+            for (i, h, c), e in zip(fresh, embs):
+                spool.add(c, meta(i, h), e)
+            start += len(batch)
+            batch = list(islice(chunks, Config.INGEST_BATCH_SIZE))
+    except BaseException:
+        spool.close()
+        raise
+    stale = [row_id for ids in existing.values() for row_id in ids]
+    return stale, updates, spool
+
+def _apply_chunks(cur, plan):
+    stale, updates, spool = plan
+    if stale:
+        cur.execute("DELETE FROM documents WHERE id = ANY(%s)", (stale,))
+    update_chunk_metadata(cur, updates)
+    spool.copy_into(cur)
+
+@metrics.timed_fn("ingest.check")
+def _check(f):
+    """
+    Upsert title/url and decide from the listing alone whether f needs work.
+
+    Returns a job dict for the next stages, or None when the stored
+    modifiedTime / Drive md5Checksum shows the file is unchanged.
+    """
+    file_id, title, url = f["id"], f["name"], f.get("webViewLink")
+    modified = f.get("modifiedTime")
+
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT modified_time, checksum FROM document_metadata WHERE id=%s", (file_id,))
+        prev = cur.fetchone()
         cur.execute("""
             INSERT INTO document_metadata (id, title, url)
             VALUES (%s,%s,%s)
             ON CONFLICT (id) DO UPDATE SET title=EXCLUDED.title, url=EXCLUDED.url
         """, (file_id, title, url))
         conn.commit()
+    prev_modified, prev_checksum = prev if prev else (None, None)
 
-    if mime == "application/pdf":
-        text = extract_pdf_text(_download(service, file_id))
-        chunks = chunk_text(text, Config.CHUNK_SIZE, Config.CHUNK_OVERLAP)
-        embs = embed_texts(chunks) if chunks else []
-        with get_db_connection() as conn, conn.cursor() as cur:
-            for i,(c,e) in enumerate(zip(chunks, embs)):
-                cur.execute("INSERT INTO documents (content, metadata, embedding) VALUES (%s,%s,%s)",
-                            (c, json.dumps({"doc_id":file_id,"file_title":title,"chunk_index":i}), e))
-            conn.commit()
-
-    elif mime == "application/vnd.google-apps.document":
-        text = extract_google_doc_text(_export(service, file_id, "text/plain"))
-        chunks = chunk_text(text, Config.CHUNK_SIZE, Config.CHUNK_OVERLAP)
-        embs = embed_texts(chunks) if chunks else []
-        with get_db_connection() as conn, conn.cursor() as cur:
-            for i,(c,e) in enumerate(zip(chunks, embs)):
-                cur.execute("INSERT INTO documents (content, metadata, embedding) VALUES (%s,%s,%s)",
-                            (c, json.dumps({"doc_id":file_id,"file_title":title,"chunk_index":i}), e))
-            conn.commit()
-
-    elif mime == "application/vnd.google-apps.spreadsheet":
-        rows = extract_csv_rows(_export(service, file_id, "text/csv"))
-        if rows:
-            with get_db_connection() as conn, conn.cursor() as cur:
-                for r in rows:
-                    cur.execute("INSERT INTO document_rows (dataset_id, row_data) VALUES (%s,%s)", (file_id, json.dumps(r)))
-                cur.execute("UPDATE document_metadata SET schema=%s WHERE id=%s", (json.dumps(keys_schema(rows)), file_id))
-                conn.commit()
-
-def main(once: bool = False):
-    service = _drive()
-    q = f"'{Config.GOOGLE_FOLDER_ID}' in parents and (mimeType != 'application/vnd.google-apps.folder')"
+    if modified and prev_modified == modified:
+        return None
+    # Binary files carry an md5 in the listing, so a rename/touch needs no download.
+    if f.get("md5Checksum") and f["md5Checksum"] == prev_checksum:
+        _mark_synced_now(file_id, modified, prev_checksum)
+        return None
+    return {"file": f, "prev_checksum": prev_checksum}
+
+@metrics.timed_fn("ingest.fetch")
+def _fetch_stage(service, job):
+    """Download/export the file to a temp file; None if its bytes are unchanged after all."""
+    f = job["file"]
+    path, checksum = _fetch(service, f)
+    if checksum and checksum == job["prev_checksum"]:
+        _remove(path)
+        _mark_synced_now(f["id"], f.get("modifiedTime"), checksum)
+        return None
+    return dict(job, path=path, checksum=checksum)
+
+def extract(mime, path):
+    """
+    CPU-bound extraction from the downloaded file; a plain top-level function
+    so it can run in a process pool. Text is written page by page to a temp
+    file, returned as ("text", text_path); sheets are streamed later from the
+    exported CSV, returned as ("rows", path).
+    """
+    if mime == GSHEET:
+        return "rows", path
+    if mime == PDF:
+        pieces = iter_pdf_pages(path)
+    elif mime == GDOC:
+        pieces = iter_text_file(path)
+    else:
+        return None, None
+    out = tempfile.NamedTemporaryFile("w", encoding="utf-8", prefix="text-", suffix=".txt", delete=False)
+    try:
+        with out:
+            for piece in pieces:
+                out.write(piece)
+    except BaseException:
+        _remove(out.name)
+        raise
+    return "text", out.name
+
+@metrics.timed_fn("ingest.extract")
+def _extract_stage(job, run=None):
+    """Extract (optionally via `run`, e.g. a process pool) and drop the raw download."""
+    mime, path = job["file"]["mimeType"], job["path"]
+    kind, value = (run or extract)(mime, path)
+    if value != path:
+        _remove(path)
+    return dict(job, path=None, extracted=(kind, value))
+
+@metrics.timed_fn("ingest.embed")
+def _embed_stage(job):
+    """Chunk-diff and embed text documents (rows pass straight through)."""
+    f, (kind, value) = job["file"], job["extracted"]
+    plan = _plan_chunks(f["id"], f["name"], value) if kind == "text" else None
+    return dict(job, plan=plan)
+
+@metrics.timed_fn("ingest.write")
+def _write_stage(job):
+    """Replace the file's content in ONE transaction so readers never observe a half-written or empty document."""
+    f, (kind, value), plan = job["file"], job["extracted"], job.get("plan")
+    file_id = f["id"]
+    with get_db_connection() as conn, conn.cursor() as cur:
+        if plan is not None:
+            _apply_chunks(cur, plan)
+        if kind == "rows":
+            cur.execute("DELETE FROM document_rows WHERE dataset_id=%s", (file_id,))
+            head = list(islice(iter_csv_rows(value), 50))
+            if head:
+                types = ColumnTypes()
+                copy_document_rows(cur, file_id, types.observe_all(iter_csv_rows(value)))
+                typed = types.schema()
+                table, typed = materialize_dataset(cur, file_id, typed, Config.DATASET_MAX_INDEXES,
+                                                   Config.SQL_READER_ROLE)
+                cur.execute("UPDATE document_metadata SET schema=%s, typed_schema=%s, dataset_table=%s WHERE id=%s",
+                            (json.dumps(keys_schema(head)), json.dumps(typed), table, file_id))
+            else:
+                drop_dataset(cur, file_id)
+                cur.execute("UPDATE document_metadata SET typed_schema=NULL, dataset_table=NULL WHERE id=%s", (file_id,))
+        _mark_synced(cur, file_id, f.get("modifiedTime"), job["checksum"])
+        # Last statement: the row lock on corpus_state is held only until commit.
+        bump_corpus_version(cur, file_id)
+    return job
+
+def _cleanup(job):
+    """Release a job's temp files and staged COPY data (after success or failure)."""
+    if not isinstance(job, dict):
+        return
+    kind, value = job.get("extracted") or (None, None)
+    _remove(job.get("path"), value)
+    plan = job.get("plan")
+    if plan is not None:
+        plan[2].close()
+
+def process_file(service, f):
+    """
+    Ingest one Drive file if it changed since the last poll (sequential path).
+
+    Returns False when the stored modifiedTime (or content checksum) shows the
+    file is unchanged, True when its content was (re)written.
+    """
+    job = _check(f)
+    if job is not None:
+        job = _fetch_stage(service, job)
+    if job is None:
+        return False
+    try:
+        job = _extract_stage(job)
+        job = _embed_stage(job)
+        _write_stage(job)
+    finally:
+        _cleanup(job)
+    return True
+
+def _mark_synced(cur, file_id, modified, checksum):
+    cur.execute("UPDATE document_metadata SET modified_time=%s, checksum=%s WHERE id=%s",
+                (modified, checksum, file_id))
+
+def bump_corpus_version(cur, *doc_ids):
+    """
+    Invalidate answers cached against the previous corpus (see rag.agent) and
+    record which documents changed at the new version, so the vector mirror
+    (rag.vector_mirror) re-reads only those.
+    """
+    cur.execute("UPDATE corpus_state SET version = version + 1, updated_at = NOW() RETURNING version")
+    version = cur.fetchone()[0]
+    for doc_id in doc_ids:
+        cur.execute("INSERT INTO document_changes (version, doc_id) VALUES (%s, %s)", (version, doc_id))
+    return version
+
+def _after_pass():
+    """Prune old change markers and bring the local vector mirror up to date."""
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM document_changes WHERE created_at < NOW() - make_interval(days => %s)",
+                    (Config.DOCUMENT_CHANGES_RETENTION_DAYS,))
+    if Config.VECTOR_MIRROR:
+        try:
+            print("Vector mirror:", vector_mirror.sync())
+        except Exception as e:
+            print("Vector mirror sync failed:", e)
+
+def _mark_synced_now(file_id, modified, checksum):
+    with get_db_connection() as conn, conn.cursor() as cur:
+        _mark_synced(cur, file_id, modified, checksum)
+
+FOLDER = "application/vnd.google-apps.folder"
+FILE_FIELDS = "id,name,mimeType,webViewLink,modifiedTime,md5Checksum,parents,trashed"
+
+def _list_files(service):
+    """Every file in GOOGLE_FOLDER_ID, following nextPageToken."""
+    q = f"'{Config.GOOGLE_FOLDER_ID}' in parents and mimeType != '{FOLDER}' and trashed = false"
+    files, token = [], None
     while True:
-        res = service.files().list(q=q, spaces="drive",
-                                   fields="files(id,name,mimeType,webViewLink,modifiedTime)",
+        res = service.files().list(q=q, spaces="drive", pageSize=Config.DRIVE_PAGE_SIZE, pageToken=token,
+                                   fields=f"nextPageToken,files({FILE_FIELDS})",
                                    includeItemsFromAllDrives=True, supportsAllDrives=True).execute()
-        files = res.get("files", [])
-        print(f"Found {len(files)} files.")
-        for f in files:
-            try:
-                process_file(service, f)
-                print(f"Processed: {f['name']} ({f['id']})")
-            except Exception as e:
-                print("Error processing", f.get("name"), e)
-        if once:
+        files += res.get("files", [])
+        token = res.get("nextPageToken")
+        if not token:
+            return files
+
+def _in_folder(f):
+    return (f is not None and not f.get("trashed") and f.get("mimeType") != FOLDER
+            and Config.GOOGLE_FOLDER_ID in (f.get("parents") or []))
+
+def _start_page_token(service):
+    return service.changes().getStartPageToken(supportsAllDrives=True).execute()["startPageToken"]
+
+def _left_folder(f):
+    """True only on evidence: removed (None), trashed, or a parents list without the folder."""
+    return f is None or bool(f.get("trashed")) or (
+        "parents" in f and Config.GOOGLE_FOLDER_ID not in (f["parents"] or []))
+
+def _list_changes(service, token):
+    """
+    Drive changes since `token`, following nextPageToken: (files added or
+    modified in the folder, ids of files deleted, trashed or moved out of it,
+    the next start page token). A file's last change wins. A change without a
+    file payload (e.g. a permission change hiding its fields) is skipped, not
+    taken as a deletion.
+    """
+    latest = {}
+    while True:
+        res = service.changes().list(pageToken=token, spaces="drive", pageSize=Config.DRIVE_PAGE_SIZE,
+                                     fields=f"nextPageToken,newStartPageToken,"
+                                            f"changes(fileId,removed,file({FILE_FIELDS}))",
+                                     includeItemsFromAllDrives=True, supportsAllDrives=True).execute()
+        for c in res.get("changes", []):
+            if not c.get("fileId"):  # shared-drive changes have no fileId
+                continue
+            if c.get("removed"):
+                latest[c["fileId"]] = None
+            elif c.get("file"):
+                latest[c["fileId"]] = c["file"]
+        if res.get("newStartPageToken"):
             break
-        print(f"Sleeping {Config.POLL_INTERVAL_SECONDS}s... (Ctrl+C to stop)")
-        time.sleep(Config.POLL_INTERVAL_SECONDS)
+        token = res["nextPageToken"]
+    files = [f for f in latest.values() if _in_folder(f)]
+    gone = [file_id for file_id, f in latest.items() if _left_folder(f)]
+    return files, gone, res["newStartPageToken"]
+
+def _load_page_token():
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT start_page_token FROM drive_sync_state WHERE folder_id=%s", (Config.GOOGLE_FOLDER_ID,))
+        row = cur.fetchone()
+    return row[0] if row else None
+
+def _save_page_token(token):
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("""INSERT INTO drive_sync_state (folder_id, start_page_token) VALUES (%s, %s)
+                       ON CONFLICT (folder_id) DO UPDATE
+                       SET start_page_token = EXCLUDED.start_page_token, updated_at = NOW()""",
+                    (Config.GOOGLE_FOLDER_ID, token))
+
+def _load_retries():
+    """Files that failed an earlier pass (as listed then), retried until they succeed."""
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT file FROM drive_retry WHERE folder_id=%s ORDER BY updated_at", (Config.GOOGLE_FOLDER_ID,))
+        return [r[0] for r in cur.fetchall()]
+
+def _update_retries(failures, done):
+    """Record this pass's failures ([(file, error)]) and forget the retries of `done` ids."""
+    with get_db_connection() as conn, conn.cursor() as cur:
+        if done:
+            cur.execute("DELETE FROM drive_retry WHERE folder_id=%s AND file_id = ANY(%s)",
+                        (Config.GOOGLE_FOLDER_ID, list(done)))
+        for f, error in failures:
+            cur.execute("""INSERT INTO drive_retry (folder_id, file_id, file, last_error) VALUES (%s, %s, %s, %s)
+                           ON CONFLICT (folder_id, file_id) DO UPDATE
+                           SET file = EXCLUDED.file, last_error = EXCLUDED.last_error,
+                               attempts = drive_retry.attempts + 1, updated_at = NOW()""",
+                        (Config.GOOGLE_FOLDER_ID, f["id"], json.dumps(f), str(error)[:1000]))
+
+def delete_files(file_ids):
+    """
+    Remove ingested files that left the folder (deleted, trashed or moved):
+    chunks, rows, typed dataset table and metadata, in one transaction.
+    Ids that were never ingested are ignored. Returns the removed ids.
+    """
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id FROM document_metadata WHERE id = ANY(%s)", (list(file_ids),))
+        removed = [r[0] for r in cur.fetchall()]
+        for file_id in removed:
+            cur.execute("DELETE FROM documents WHERE metadata->>'doc_id'=%s", (file_id,))
+            cur.execute("DELETE FROM document_rows WHERE dataset_id=%s", (file_id,))
+            drop_dataset(cur, file_id)
+            cur.execute("DELETE FROM document_metadata WHERE id=%s", (file_id,))
+        if removed:
+            bump_corpus_version(cur, *removed)
+    return removed
+
+def _unlisted_files(listed):
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id FROM document_metadata WHERE NOT (id = ANY(%s))", (list(listed),))
+        return [r[0] for r in cur.fetchall()]
+
+def _run_sequential(service, files):
+    """Process files one at a time; returns [(file, error)] for those that failed."""
+    failures = []
+    for f in files:
+        try:
+            with connection_scope():
+                changed = process_file(service, f)
+            print(f"{'Processed' if changed else 'Unchanged'}: {f['name']} ({f['id']})")
+        except Exception as e:
+            failures.append((f, e))
+            print("Error processing", f.get("name"), e)
+    return failures
+
+def build_pipeline(extract_pool, failures=None):
+    """
+    check+fetch (threads, Drive I/O) -> extract (process pool, all cores)
+    -> embed (threads, API-bound) -> write (threads, DB-bound), joined by bounded queues.
+    Files that fail in any stage are appended to `failures` as (file, error).
+    """
+    local = threading.local()
+
+    def fetch(f):
+        # googleapiclient services are not thread-safe: one per fetch worker.
+        if not hasattr(local, "service"):
+            local.service = _drive()
+        job = _check(f)
+        return _fetch_stage(local.service, job) if job is not None else None
+
+    def extract_in_pool(job):
+        try:
+            return _extract_stage(job, lambda mime, path: extract_pool.submit(extract, mime, path).result())
+        except BaseException:
+            _cleanup(job)
+            raise
+
+    def embed(job):
+        try:
+            return _embed_stage(job)
+        except BaseException:
+            _cleanup(job)
+            raise
+
+    def write(job):
+        try:
+            _write_stage(job)
+        finally:
+            _cleanup(job)
+        f = job["file"]
+        print(f"Processed: {f['name']} ({f['id']})")
+        return job
+
+    q = Config.INGEST_QUEUE_SIZE
+    stages = [
+        Stage("fetch", fetch, Config.INGEST_FETCH_WORKERS, q),
+        Stage("extract", extract_in_pool, Config.INGEST_EXTRACT_PROCESSES or os.cpu_count() or 1, q),
+        Stage("embed", embed, Config.INGEST_EMBED_WORKERS, q),
+        Stage("write", write, Config.INGEST_WRITE_WORKERS, q),
+    ]
+
+    def on_error(stage, item, e):
+        f = item.get("file", item) if isinstance(item, dict) else {}
+        print(f"Error processing ({stage.name})", f.get("name"), e)
+        if failures is not None and f.get("id"):
+            failures.append((f, e))
+
+    return Pipeline(stages, on_error=on_error)
+
+def poll_once(service, extract_pool=None, sequential: bool = False, resync: bool = False):
+    """
+    One poll pass. Without a stored start page token (first run), or with
+    resync, the whole folder is listed; afterwards only the Drive changes feed
+    since the stored token is read, and files that left the folder are
+    deleted. The token always advances; files that fail are recorded in
+    drive_retry and retried on their own in later passes until they succeed.
+    """
+    token = None if resync else _load_page_token()
+    tracked = resync or token is not None
+    files = None
+    if token is not None:
+        try:
+            files, gone, token = _list_changes(service, token)
+            print(f"Drive changes: {len(files)} files.")
+        except HttpError as e:
+            if e.resp.status not in (404, 410):
+                raise
+            print("Drive page token is no longer valid; re-listing the folder.")
+    if files is None:
+        # Taken before listing: changes made while this pass runs are read next time.
+        token = _start_page_token(service)
+        files = _list_files(service)
+        # Reconcile deletions only for a folder we were already tracking, and
+        # never on an empty listing (e.g. lost access).
+        gone = _unlisted_files({f["id"] for f in files}) if tracked and files else []
+        print(f"Found {len(files)} files.")
+    removed = delete_files(gone) if gone else []
+    for file_id in removed:
+        print(f"Removed: {file_id}")
+    # Earlier failures the feed didn't mention again (a newer listing of a file wins).
+    skip = {f["id"] for f in files} | set(gone)
+    retries = [f for f in _load_retries() if f["id"] not in skip]
+    if retries:
+        print(f"Retrying {len(retries)} file(s) that failed earlier.")
+    files = files + retries
+    out = {"files": len(files), "removed": removed, "retried": len(retries)}
+    if sequential:
+        failures = _run_sequential(service, files)
+    else:
+        failures = []
+        pipeline = build_pipeline(extract_pool, failures)
+        pipeline.run(files)
+        print(pipeline.report())
+        out["stages"] = {m["stage"]: m for m in pipeline.metrics()}
+    failed_ids = {f["id"] for f, _ in failures}
+    _update_retries(failures, ({f["id"] for f in files} - failed_ids) | set(gone))
+    if failures:
+        print(f"{len(failed_ids)} file(s) failed; they are retried next pass.")
+    _save_page_token(token)
+    return dict(out, failed=len(failed_ids))
+
+def main(once: bool = False, sequential: bool = False, metrics_port: int = 0, resync: bool = False):
+    if metrics_port:
+        metrics.start_http_server(metrics_port)
+    service = _drive()
+    extract_pool = None
+    if not sequential:
+        extract_pool = ProcessPoolExecutor(max_workers=Config.INGEST_EXTRACT_PROCESSES or None)
+    try:
+        while True:
+            poll_once(service, extract_pool, sequential, resync)
+            resync = False
+            _after_pass()
+            if once:
+                break
+            print(f"Sleeping {Config.POLL_INTERVAL_SECONDS}s... (Ctrl+C to stop)")
+            time.sleep(Config.POLL_INTERVAL_SECONDS)
+    finally:
+        if extract_pool is not None:
+            extract_pool.shutdown()
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--once", action="store_true")
+    parser.add_argument("--sequential", action="store_true", help="process files one at a time (no pipeline)")
+    parser.add_argument("--metrics-port", type=int, default=0, help="serve Prometheus metrics on this port")
+    parser.add_argument("--resync", action="store_true", help="re-list the whole folder instead of reading changes")
     args = parser.parse_args()
-    main(once=args.once)
+    main(once=args.once, sequential=args.sequential, metrics_port=args.metrics_port, resync=args.resync)
@@ -0,0 +1,112 @@
+import queue, threading, time
+from typing import Any, Callable, Dict, Iterable, List
+
+_STOP = object()
+
+
+class Stage:
+    """
+    One pipeline stage: `workers` threads pull from a bounded input queue, run
+    `fn(item)` and hand the result downstream. Returning None drops the item
+    (e.g. an unchanged file); exceptions are reported via `on_error` and drop it.
+    """
+
+    def __init__(self, name: str, fn: Callable[[Any], Any], workers: int = 1, queue_size: int = 8):
+        self.name, self.fn = name, fn
+        self.workers = max(1, workers)
+        self.inbox = queue.Queue(maxsize=max(1, queue_size))
+        self._lock = threading.Lock()
+        self.processed = self.dropped = self.errors = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+
+    def _record(self, elapsed, outcome):
+        with self._lock:
+            self.busy_seconds += elapsed
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def put(self, item):
+        self.inbox.put(item)
+        depth = self.inbox.qsize()
+        with self._lock:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def metrics(self, elapsed: float) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "stage": self.name,
+                "workers": self.workers,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "busy_seconds": round(self.busy_seconds, 3),
+                # share of the wall time the stage's workers were busy: ~1.0 = bottleneck
+                "utilization": round(self.busy_seconds / (elapsed * self.workers), 3) if elapsed else 0.0,
+                "items_per_second": round(self.processed / elapsed, 3) if elapsed else 0.0,
+                "queue_depth": self.inbox.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+            }
+
+
+class Pipeline:
+    """
+    Run items through a chain of Stages connected by bounded queues.
+
+    A full queue blocks the upstream stage (back-pressure), so memory stays
+    bounded by the queue sizes no matter how many items are fed in.
+    """
+
+    def __init__(self, stages: List[Stage], on_error: Callable[[Stage, Any, Exception], None] = None):
+        self.stages = stages
+        self.on_error = on_error or (lambda stage, item, e: print(f"[{stage.name}] error:", e))
+        self.elapsed = 0.0
+
+    def _worker(self, idx: int):
+        stage = self.stages[idx]
+        nxt = self.stages[idx + 1] if idx + 1 < len(self.stages) else None
+        while True:
+            item = stage.inbox.get()
+            if item is _STOP:
+                return
+            t0 = time.perf_counter()
+            try:
+                out = stage.fn(item)
+            except Exception as e:
+                stage._record(time.perf_counter() - t0, "errors")
+                self.on_error(stage, item, e)
+                continue
+            stage._record(time.perf_counter() - t0, "processed" if out is not None else "dropped")
+            if out is not None and nxt is not None:
+                nxt.put(out)
+
+    def run(self, items: Iterable[Any]):
+        started = time.perf_counter()
+        threads = []
+        for idx, stage in enumerate(self.stages):
+            ts = [threading.Thread(target=self._worker, args=(idx,), name=f"ingest-{stage.name}-{n}", daemon=True)
+                  for n in range(stage.workers)]
+            for t in ts:
+                t.start()
+            threads.append(ts)
+        for item in items:
+            self.stages[0].put(item)
+        # Drain stage by stage: once every worker of a stage has stopped,
+        # nothing more can reach the next one.
+        for stage, ts in zip(self.stages, threads):
+            for _ in ts:
+                stage.put(_STOP)
+            for t in ts:
+                t.join()
+        self.elapsed = time.perf_counter() - started
+
+    def metrics(self) -> List[Dict[str, Any]]:
+        return [s.metrics(self.elapsed) for s in self.stages]
+
+    def report(self) -> str:
+        lines = [f"pipeline: {self.elapsed:.2f}s"]
+        for m in self.metrics():
+            lines.append(f"  {m['stage']:<8} workers={m['workers']} done={m['processed']} "
+                         f"skipped={m['dropped']} errors={m['errors']} "
+                         f"{m['items_per_second']:.2f}/s util={m['utilization']:.0%} "
+                         f"max_queue={m['max_queue_depth']}")
+        return "\n".join(lines)
@@ -1,5 +1,6 @@
-import io, csv
-from typing import Dict, Any, List
+import io, csv, codecs, math, re
+from datetime import date, datetime
+from typing import Dict, Any, Iterator, List
 import pandas as pd
 from PyPDF2 import PdfReader
 
@@ -13,6 +14,45 @@ def extract_pdf_text(content: bytes) -> str:
     except Exception:
         return content.decode("utf-8", errors="ignore")
 
+def iter_pdf_pages(path: str) -> Iterator[str]:
+    """Yield a PDF's text page by page (only one page's text in memory at a time)."""
+    with open(path, "rb") as fh:
+        try:
+            pages = PdfReader(fh).pages
+        except Exception:
+            pages = None
+        if pages is None:
+            # Same fallback as extract_pdf_text: treat unreadable PDFs as text.
+            yield from iter_text_file(path)
+            return
+        for i, p in enumerate(pages):
+            try:
+                text = p.extract_text() or ""
+            except Exception:
+                text = ""
+            yield ("\n" if i else "") + text
+
+def iter_text_file(path: str, block_size: int = 1 << 20) -> Iterator[str]:
+    """Yield a UTF-8 file as decoded text blocks."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    with open(path, "rb") as fh:
+        while True:
+            block = fh.read(block_size)
+            if not block:
+                break
+            text = decoder.decode(block)
+            if text:
+                yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+def iter_csv_rows(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream CSV rows from a file without loading it whole."""
+    with open(path, "r", encoding="utf-8", errors="ignore", newline="") as fh:
+        for row in csv.DictReader(fh):
+            yield dict(row)
+
 def extract_google_doc_text(content: bytes) -> str:
     return content.decode("utf-8", errors="ignore")
 
@@ -31,3 +71,87 @@ def keys_schema(rows: List[Dict[str, Any]]) -> List[str]:
     for r in rows[:50]:
         keys.update(r.keys())
     return sorted(keys)
+
+# Cell values are trimmed of CELL_WHITESPACE only (the same characters
+# materialize_dataset's btrim() removes) and matched as ASCII, so every value
+# inferred here casts in Postgres.
+CELL_WHITESPACE = " \t\r\n\f\v"
+
+_BIGINT = re.compile(r"^[+-]?\d{1,18}$", re.ASCII)
+_DOUBLE = re.compile(r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$", re.ASCII)
+_BOOLEAN = re.compile(r"^(true|false)$", re.IGNORECASE)
+_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$", re.ASCII)
+_TIMESTAMP = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?(Z|[+-]\d{2}(:?\d{2})?)?$", re.ASCII)
+# Digit strings with a leading zero (SKUs, zip codes, phone numbers) are identifiers: keep them text.
+_LEADING_ZERO = re.compile(r"^[+-]?0\d", re.ASCII)
+
+def _valid_double(v):
+    # double precision rejects overflow (1e999) and underflow to zero (1e-400).
+    f = float(v)
+    return math.isfinite(f) and (f != 0 or not re.search(r"[1-9]", v.split("e")[0].split("E")[0]))
+
+def _valid_date(v):
+    try:
+        date.fromisoformat(v)
+        return True
+    except ValueError:
+        return False
+
+def _valid_timestamp(v):
+    try:
+        datetime.fromisoformat(v)
+        return True
+    except ValueError:
+        return False
+
+# Narrowest first; a column gets the first type every non-empty value satisfies.
+COLUMN_TYPES = (
+    ("bigint", lambda v: bool(_BIGINT.match(v)) and not _LEADING_ZERO.match(v)),
+    ("double precision", lambda v: bool(_DOUBLE.match(v)) and not _LEADING_ZERO.match(v) and _valid_double(v)),
+    ("boolean", lambda v: bool(_BOOLEAN.match(v))),
+    ("date", lambda v: bool(_DATE.match(v)) and _valid_date(v)),
+    ("timestamptz", lambda v: bool(_TIMESTAMP.match(v)) and _valid_timestamp(v)),
+)
+
+def column_name(key: str) -> str:
+    """SQL-friendly snake_case column name for a spreadsheet header."""
+    name = re.sub(r"[^a-z0-9]+", "_", str(key).lower()).strip("_") or "col"
+    return name if not name[0].isdigit() else f"c_{name}"
+
+class ColumnTypes:
+    """
+    Streaming type inference over spreadsheet rows (the typed counterpart of
+    keys_schema). Empty cells are ignored; columns with no values are text.
+    """
+
+    def __init__(self):
+        self._candidates: Dict[str, set] = {}
+
+    def observe(self, row: Dict[str, Any]):
+        for k, v in row.items():
+            if k is None:
+                continue
+            cands = self._candidates.setdefault(k, {t for t, _ in COLUMN_TYPES})
+            if v is None or not cands:
+                continue
+            v = str(v).strip(CELL_WHITESPACE)
+            if v:
+                cands.difference_update([t for t, ok in COLUMN_TYPES if t in cands and not ok(v)])
+
+    def observe_all(self, rows: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for r in rows:
+            self.observe(r)
+            yield r
+
+    def schema(self) -> List[Dict[str, str]]:
+        out, used = [], set()
+        for key, cands in self._candidates.items():
+            col = base = column_name(key)
+            n = 2
+            while col in used:
+                col, n = f"{base}_{n}", n + 1
+            used.add(col)
+            all_empty = len(cands) == len(COLUMN_TYPES)
+            typ = next((t for t, _ in COLUMN_TYPES if t in cands), "text") if not all_empty else "text"
+            out.append({"column": col, "source": key, "type": typ})
+        return out
@@ -0,0 +1,107 @@
+import json, struct, tempfile
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+from psycopg2.extras import execute_values
+
+# PostgreSQL binary COPY framing: signature, flags, header-extension length.
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_COPY_TRAILER = struct.pack(">h", -1)
+_JSONB_VERSION = b"\x01"
+
+
+def _field(data: bytes) -> bytes:
+    return struct.pack(">i", len(data)) + data
+
+
+def _null() -> bytes:
+    return struct.pack(">i", -1)
+
+
+def vector_binary(vec: Sequence[float]) -> bytes:
+    """pgvector's binary wire format: int16 dim, int16 unused, float32[dim] (big-endian)."""
+    return struct.pack(f">hh{len(vec)}f", len(vec), 0, *vec)
+
+
+def _jsonb_binary(obj) -> bytes:
+    return _JSONB_VERSION + json.dumps(obj, default=str).encode("utf-8")
+
+
+class CopySpool:
+    """
+    Binary COPY payload for one table, built row by row and spooled to a temp
+    file once it exceeds `max_memory` bytes, so peak memory stays bounded no
+    matter how many rows are staged before the COPY runs.
+    """
+
+    table = None
+    columns = ()
+
+    def __init__(self, max_memory: int = 8 << 20):
+        self._fh = tempfile.SpooledTemporaryFile(max_size=max_memory)
+        self._fh.write(_COPY_HEADER)
+        self._ncols = struct.pack(">h", len(self.columns))
+        self.rows = 0
+
+    def _write(self, *fields: bytes):
+        self._fh.write(self._ncols)
+        for f in fields:
+            self._fh.write(f)
+        self.rows += 1
+
+    def copy_into(self, cur):
+        if self.rows:
+            self._fh.write(_COPY_TRAILER)
+            self._fh.seek(0)
+            cur.copy_expert(f"COPY {self.table} ({', '.join(self.columns)}) FROM STDIN WITH (FORMAT binary)", self._fh)
+
+    def close(self):
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DocumentSpool(CopySpool):
+    table, columns = "documents", ("content", "metadata", "embedding")
+
+    def add(self, content: str, metadata: Dict[str, Any], embedding: Sequence[float]):
+        self._write(_field(content.encode("utf-8")),
+                    _field(_jsonb_binary(metadata)),
+                    _field(vector_binary(embedding)) if embedding is not None else _null())
+
+
+class DocumentRowSpool(CopySpool):
+    table, columns = "document_rows", ("dataset_id", "row_data")
+
+    def add(self, dataset_id: str, row: Dict[str, Any]):
+        self._write(_field(dataset_id.encode("utf-8")), _field(_jsonb_binary(row)))
+
+
+def copy_documents(cur, rows: Iterable[Tuple[str, Dict[str, Any], Sequence[float]]]):
+    """Bulk-insert (content, metadata, embedding) rows into `documents` with binary COPY."""
+    with DocumentSpool() as spool:
+        for content, metadata, embedding in rows:
+            spool.add(content, metadata, embedding)
+        spool.copy_into(cur)
+
+
+def copy_document_rows(cur, dataset_id: str, rows: Iterable[Dict[str, Any]]):
+    """Bulk-insert spreadsheet rows for one dataset into `document_rows` with binary COPY."""
+    with DocumentRowSpool() as spool:
+        for r in rows:
+            spool.add(dataset_id, r)
+        spool.copy_into(cur)
+        return spool.rows
+
+
+def update_chunk_metadata(cur, updates: List[Tuple[int, Dict[str, Any]]]):
+    """Merge metadata into existing `documents` rows in one statement, skipping no-op rows."""
+    if not updates:
+        return
+    execute_values(cur, """
+        UPDATE documents d SET metadata = d.metadata || v.m::jsonb
+        FROM (VALUES %s) AS v(id, m)
+        WHERE d.id = v.id AND NOT d.metadata @> v.m::jsonb
+    """, [(row_id, json.dumps(m)) for row_id, m in updates], page_size=1000)
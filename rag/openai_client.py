@@ -0,0 +1,183 @@
+"""
+Shared HTTP client for the OpenAI API.
+
+One keep-alive connection pool per process (requests.Session; an
+httpx.AsyncClient per event loop for the asyncio agent), a common retry
+policy for 429/5xx and connection errors that honours OpenAI's rate-limit
+headers, and OPENAI_BASE_URL so a local stand-in can be used.
+"""
+import asyncio, logging, os, random, re, threading, time, weakref
+from contextlib import asynccontextmanager
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+
+try:
+    import httpx
+except ImportError:  # optional: only the asyncio agent (asgi.py) needs it
+    httpx = None
+
+log = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _parse_duration(value):
+    """Parse OpenAI reset headers like '1s', '20ms', '6m0s' into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total, matched = 0.0, False
+    for num, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        matched = True
+        total += float(num) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total if matched else None
+
+
+def retry_delay(headers, attempt: int) -> float:
+    """Seconds to wait before retry `attempt`: the server's hint if any, else jittered backoff."""
+    backoff = min(60.0, 2 ** attempt) + random.uniform(0, 1)
+    if headers is None:
+        return backoff
+    ms = headers.get("retry-after-ms")
+    hinted = [float(ms) / 1000] if ms else []
+    for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        d = _parse_duration(headers.get(name))
+        if d is not None:
+            hinted.append(d)
+    return min(max(hinted), 60.0) if hinted else backoff
+
+
+def _url(path):
+    return f"{Config.OPENAI_BASE_URL}{path}"
+
+
+def _headers():
+    return {"Authorization": f"Bearer {Config.OPENAI_API_KEY}"}
+
+
+def _retries(retries):
+    return Config.OPENAI_MAX_RETRIES if retries is None else retries
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def session() -> requests.Session:
+    """Process-wide keep-alive session (re-created after a fork)."""
+    global _session, _session_pid
+    if _session is not None and _session_pid == os.getpid():
+        return _session
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, Config.OPENAI_POOL_SIZE))
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            _session, _session_pid = s, os.getpid()
+    return _session
+
+
+def post(path: str, payload, retries=None, stream: bool = False) -> requests.Response:
+    """
+    POST JSON to the API over the pooled session. 429/5xx and connection
+    errors are retried up to `retries` times (default OPENAI_MAX_RETRIES);
+    other errors raise requests.HTTPError. With stream=True the caller must
+    close the returned response.
+    """
+    retries = _retries(retries)
+    timeout = (Config.OPENAI_CONNECT_TIMEOUT_SECONDS, Config.OPENAI_TIMEOUT_SECONDS)
+    for attempt in range(retries + 1):
+        try:
+            r = session().post(_url(path), json=payload, headers=_headers(), timeout=timeout, stream=stream)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+            r = None
+        if r is not None and (r.status_code not in RETRY_STATUSES or attempt == retries):
+            if r.status_code >= 400:
+                r.content  # read the error body so the connection goes back to the pool
+                r.raise_for_status()
+            return r
+        if r is not None:
+            r.close()
+        delay = retry_delay(r.headers if r is not None else None, attempt)
+        log.warning("OpenAI %s throttled/failed (attempt %d), retrying in %.1fs", path, attempt + 1, delay)
+        time.sleep(delay)
+
+
+# --- asyncio -----------------------------------------------------------------
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def async_client():
+    """httpx.AsyncClient bound to the running event loop (one pool per loop)."""
+    if httpx is None:
+        raise RuntimeError("The asyncio agent needs httpx: pip install -r requirements.txt")
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = httpx.AsyncClient(
+            timeout=httpx.Timeout(Config.OPENAI_TIMEOUT_SECONDS, connect=Config.OPENAI_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(max_connections=Config.OPENAI_ASYNC_MAX_CONNECTIONS,
+                                max_keepalive_connections=max(1, Config.OPENAI_POOL_SIZE)),
+        )
+    return client
+
+
+async def aclose():
+    """Close the running loop's client (e.g. on ASGI shutdown)."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _raise_for_status(r):
+    # Same exception type as the sync path, so callers handle both alike.
+    if r.status_code >= 400:
+        raise requests.HTTPError(f"{r.status_code} Error for url: {r.url}", response=r)
+
+
+@asynccontextmanager
+async def astream(path: str, payload, retries=None):
+    """
+    Async POST yielding the (unread) httpx response, e.g. for SSE. Retries
+    (like post()) apply until a non-retryable status arrives; the body is
+    never replayed.
+    """
+    client, retries = async_client(), _retries(retries)
+    for attempt in range(retries + 1):
+        request = client.build_request("POST", _url(path), json=payload, headers=_headers())
+        try:
+            r = await client.send(request, stream=True)
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+            r = None
+        if r is not None and (r.status_code not in RETRY_STATUSES or attempt == retries):
+            try:
+                if r.status_code >= 400:
+                    await r.aread()
+                    _raise_for_status(r)
+                yield r
+            finally:
+                await r.aclose()
+            return
+        if r is not None:
+            await r.aclose()
+        delay = retry_delay(r.headers if r is not None else None, attempt)
+        log.warning("OpenAI %s throttled/failed (attempt %d), retrying in %.1fs", path, attempt + 1, delay)
+        await asyncio.sleep(delay)
+
+
+async def apost(path: str, payload, retries=None):
+    """Async POST returning the parsed JSON body (same retry policy as post())."""
+    async with astream(path, payload, retries) as r:
+        await r.aread()
+        return r.json()
@@ -1,40 +1,311 @@
-from typing import Dict, Any, List
+import re
+from typing import Dict, Any, List, Optional
+from psycopg2 import sql as pgsql
+from config import Config
 from db import get_db_connection
-from .embeddings import embed_texts
+from metrics import timed, timed_fn
+from . import vector_mirror, vector_storage
+from .embeddings import count_tokens, embed_texts
 
 TOP_K = 6
+HNSW_DEFAULT_EF_SEARCH = 40  # pgvector's default
 
-def rag_search(query: str) -> List[Dict[str, Any]]:
+def set_ann_params(cur, ef_search: Optional[int] = None, probes: Optional[int] = None, candidates: int = 0):
+    """
+    Transaction-local hnsw.ef_search / ivfflat.probes (falls back to Config; 0/None = server default).
+    ef_search is raised to `candidates` when lower, since HNSW returns at most ef_search rows.
+    """
+    ef_search = ef_search if ef_search is not None else Config.HNSW_EF_SEARCH
+    probes = probes if probes is not None else Config.IVFFLAT_PROBES
+    if candidates > (ef_search or HNSW_DEFAULT_EF_SEARCH):
+        ef_search = candidates
+    if ef_search:
+        cur.execute("SELECT set_config('hnsw.ef_search', %s, true)", (str(int(ef_search)),))
+    if probes:
+        cur.execute("SELECT set_config('ivfflat.probes', %s, true)", (str(int(probes)),))
+
+@timed_fn("tool.rag_search")
+def rag_search(query: str, ef_search: Optional[int] = None, probes: Optional[int] = None,
+               hybrid: Optional[bool] = None, full_text_weight: Optional[float] = None,
+               semantic_weight: Optional[float] = None, mmr: Optional[bool] = None,
+               k: int = TOP_K, mirror: Optional[bool] = None) -> List[Dict[str, Any]]:
+    """
+    Top-k chunks for `query`. With hybrid=True (default: RAG_HYBRID) full-text
+    and vector matches are fused by match_documents_hybrid in one round trip,
+    which finds exact identifiers (SKUs, invoice numbers, names) that pure
+    cosine similarity misses. With mmr=True (default: RAG_MMR) RAG_CANDIDATES
+    rows are fetched and re-ranked by maximal marginal relevance, which drops
+    near-duplicates such as overlapping neighbour chunks. Vector-only searches
+    use the in-process mirror when it is enabled and built (mirror=None follows
+    VECTOR_MIRROR), so Postgres only serves the final hits' content.
+    """
     vec = embed_texts([query])[0]
+    hybrid = Config.RAG_HYBRID if hybrid is None else hybrid
+    mmr = Config.RAG_MMR if mmr is None else mmr
+    count = max(k, Config.RAG_CANDIDATES) if mmr else k
+    index = None if hybrid else vector_mirror.get_mirror(mirror)
+    rows = _mirror_search(index, vec, count, k, mmr) if index is not None else None
+    if rows is not None:
+        return rows
     with get_db_connection() as conn, conn.cursor() as cur:
-        cur.execute("SELECT * FROM match_documents(%s, %s, '{}'::jsonb)", (vec, TOP_K))
+        set_ann_params(cur, ef_search, probes, vector_storage.candidate_count(count * 4 if hybrid else count))
+        with timed("match_documents_hybrid" if hybrid else "match_documents"):
+            _match(cur, query, vec, hybrid, full_text_weight, semantic_weight, count)
         cols = [c[0] for c in cur.description]
-        return [dict(zip(cols, row)) for row in cur.fetchall()]
+        rows = [dict(zip(cols, row)) for row in cur.fetchall()]
+        if not mmr or len(rows) <= 1:
+            return rows[:k]
+        with timed("mmr"):
+            sims = _pairwise_similarity(cur, [r["id"] for r in rows])
+    if hybrid:
+        top = max(r["score"] or 0.0 for r in rows) or 1.0
+        relevance = [(r["score"] or 0.0) / top for r in rows]
+    else:
+        relevance = [r["similarity"] or 0.0 for r in rows]
+    ids = [r["id"] for r in rows]
+    picked = mmr_select(relevance, lambda i, j: sims.get((ids[i], ids[j]), 0.0), k,
+                        Config.RAG_MMR_LAMBDA, Config.RAG_DEDUP_SIMILARITY)
+    return [rows[i] for i in picked]
+
+def _match(cur, query, vec, hybrid, full_text_weight, semantic_weight, count=TOP_K):
+    if hybrid:
+        cur.execute("SELECT * FROM match_documents_hybrid(%s, %s::vector, %s, '{}'::jsonb, %s, %s, %s)", (
+            query, vec, count,
+            Config.HYBRID_FULL_TEXT_WEIGHT if full_text_weight is None else full_text_weight,
+            Config.HYBRID_SEMANTIC_WEIGHT if semantic_weight is None else semantic_weight,
+            Config.HYBRID_RRF_K,
+        ))
+    else:
+        cur.execute("SELECT * FROM match_documents(%s, %s, '{}'::jsonb)", (vec, count))
+
+def _mirror_search(index, vec, count, k, mmr):
+    """
+    rag_search over the vector mirror: top-k (and MMR) in-process, then one
+    query for the hits' content. None (search Postgres) if the mirror is empty
+    or any hit has been deleted since it was synced.
+    """
+    with timed("vector_mirror"):
+        ids, scores, vectors = index.search(vec, count)
+    if not ids:
+        return None
+    if mmr and len(ids) > 1:
+        with timed("mmr"):
+            sims = vectors @ vectors.T
+        picked = mmr_select(scores, lambda i, j: float(sims[i, j]), k,
+                            Config.RAG_MMR_LAMBDA, Config.RAG_DEDUP_SIMILARITY)
+    else:
+        picked = range(min(k, len(ids)))
+    hits = [(ids[i], scores[i]) for i in picked]
+    with get_db_connection() as conn, conn.cursor() as cur:
+        # Read on its own so a stale mirror triggers a sync even when none of its hits still exist.
+        cur.execute("SELECT version FROM corpus_state")
+        row = cur.fetchone()
+        index.note_db_version(row[0] if row else None)
+        with timed("fetch_hits"):
+            cur.execute("SELECT id, content, metadata FROM documents WHERE id = ANY(%s)", ([i for i, _ in hits],))
+            found = {r[0]: r for r in cur.fetchall()}
+    if len(found) < len(hits):
+        return None  # hits deleted since the last sync: Postgres answers until the background sync catches up
+    return [{"id": i, "content": found[i][1], "metadata": found[i][2], "similarity": s} for i, s in hits]
 
+def _pairwise_similarity(cur, ids):
+    """{(a, b): cosine similarity} between the candidates' stored embeddings, computed in SQL."""
+    cur.execute("""SELECT a.id, b.id, 1 - (a.embedding <=> b.embedding)
+                   FROM documents a JOIN documents b ON a.id < b.id
+                   WHERE a.id = ANY(%s) AND b.id = ANY(%s)""", (ids, ids))
+    sims = {}
+    for a, b, sim in cur.fetchall():
+        sims[a, b] = sims[b, a] = sim or 0.0
+    return sims
+
+def mmr_select(relevance: List[float], similarity, k: int, lambda_: float = 0.7,
+               dedup: float = 1.0) -> List[int]:
+    """
+    Greedy maximal marginal relevance: indices of up to k items, each maximizing
+    lambda * relevance - (1 - lambda) * max similarity to the items already
+    picked. Items at least `dedup` similar to a picked one are dropped.
+    """
+    picked, left = [], list(range(len(relevance)))
+    redundancy = [0.0] * len(relevance)
+    while left and len(picked) < k:
+        best = max(left, key=lambda i: lambda_ * relevance[i] - (1 - lambda_) * redundancy[i])
+        picked.append(best)
+        left.remove(best)
+        for i in left:
+            redundancy[i] = max(redundancy[i], similarity(i, best))
+        left = [i for i in left if redundancy[i] < dedup]
+    return picked
+
+def _trim_to_tokens(text: str, tokens: int) -> str:
+    cut = text[:tokens * 4]
+    while cut and count_tokens(cut) > tokens:
+        cut = cut[:int(len(cut) * 0.9)]
+    if len(cut) < len(text):
+        cut = cut[:cut.rfind(" ")] if " " in cut else cut
+        cut = cut.rstrip() + " …"
+    return cut
+
+def pack_results(rows: List[Dict[str, Any]], token_budget: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Compact search hits for the model: source, position (for get_file_contents)
+    and text only, best first, until `token_budget` (default RAG_CONTEXT_TOKENS)
+    is spent. The hit that crosses the budget is cut at a word boundary.
+    """
+    budget = Config.RAG_CONTEXT_TOKENS if token_budget is None else token_budget
+    out = []
+    for r in rows:
+        meta = r.get("metadata") or {}
+        hit = {"file_id": meta.get("doc_id"), "title": meta.get("file_title"),
+               "chunk": meta.get("chunk_index"), "offset": meta.get("char_start"),
+               "score": round(float(r.get("score") or r.get("similarity") or 0.0), 4)}
+        hit = {k: v for k, v in hit.items() if v is not None}
+        content = r.get("content") or ""
+        overhead = count_tokens(str(hit)) + 4
+        cost = count_tokens(content) + overhead
+        if cost > budget:
+            if budget - overhead < 64:
+                break
+            content = _trim_to_tokens(content, budget - overhead)
+            cost = budget
+        hit["content"] = content
+        out.append(hit)
+        budget -= cost
+        if budget <= 0:
+            break
+    return out
+
+def tool_rag_search(query: str) -> List[Dict[str, Any]]:
+    """rag_search as the agent sees it: diversified, then packed to the context budget."""
+    return pack_results(rag_search(query))
+
+@timed_fn("tool.list_documents")
 def tool_list_documents():
     with get_db_connection() as conn, conn.cursor() as cur:
-        cur.execute("SELECT id, title, url, created_at, schema FROM document_metadata ORDER BY created_at DESC")
+        cur.execute("""SELECT id, title, url, created_at, schema, dataset_table, typed_schema
+                       FROM document_metadata ORDER BY created_at DESC""")
         cols = [c[0] for c in cur.description]
         return [dict(zip(cols, row)) for row in cur.fetchall()]
 
-def tool_get_file_contents(file_id: str) -> str:
-    with get_db_connection() as conn, conn.cursor() as cur:
-        cur.execute("""
-            SELECT string_agg(content, ' ') AS document_text
-            FROM documents
-            WHERE metadata->>'doc_id' = %s
-            GROUP BY metadata->>'doc_id'
-        """, (file_id,))
-        row = cur.fetchone()
-        return row[0] if row else ""
+@timed_fn("tool.get_file_contents")
+def tool_get_file_contents(file_id: str, offset: int = 0, max_chars: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Read a slice of a document's text: `max_chars` characters from `offset`.
+
+    Chunks are read in chunk_index order through the (doc_id, chunk_index)
+    index with a server-side cursor, starting at the chunk covering `offset`
+    and stopping once the slice is filled. Each chunk's position
+    (metadata.char_start, else chunk_index * step) lets the overlap between
+    neighbouring chunks be dropped. `next_offset` is None at the end.
+    """
+    offset = max(0, int(offset or 0))
+    max_chars = max(1, int(max_chars or Config.FILE_CONTENTS_PAGE_CHARS))
+    step = max(1, Config.CHUNK_SIZE - Config.CHUNK_OVERLAP)
+    end = offset + max_chars
+    parts, pos, total = [], None, 0
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT (metadata->>'chunk_index')::int, (metadata->>'char_start')::int, length(content)
+                FROM documents WHERE metadata->>'doc_id' = %s
+                ORDER BY (metadata->>'chunk_index')::int DESC LIMIT 1
+            """, (file_id,))
+            last = cur.fetchone()
+        if last is None:
+            return {"file_id": file_id, "offset": offset, "text": "", "next_offset": None, "total_chars": 0}
+        total = (last[1] if last[1] is not None else last[0] * step) + last[2]
+
+        with conn.cursor(name="file_contents") as cur:
+            cur.itersize = 16
+            cur.execute("""
+                SELECT (metadata->>'chunk_index')::int, (metadata->>'char_start')::int, content
+                FROM documents
+                WHERE metadata->>'doc_id' = %s AND (metadata->>'chunk_index')::int >= %s
+                ORDER BY (metadata->>'chunk_index')::int
+            """, (file_id, min(max(0, offset // step - 1), last[0])))
+            for idx, char_start, content in cur:
+                start = char_start if char_start is not None else idx * step
+                stop = start + len(content)
+                if stop <= offset:
+                    continue
+                lo = max(offset, pos if pos is not None else start) - start
+                hi = min(stop, end) - start
+                if hi > lo:
+                    parts.append(content[lo:hi])
+                pos = stop
+                if pos >= end:
+                    break
+
+    text = "".join(parts)
+    next_offset = offset + len(text)
+    return {
+        "file_id": file_id,
+        "offset": offset,
+        "text": text,
+        "next_offset": next_offset if next_offset < total else None,
+        "total_chars": total,
+    }
+
+# String literals (E'..' with backslash escapes, '..', $tag$..$tag$), quoted identifiers and comments.
+_SQL_QUOTED = re.compile(r"(?<![\w$])[eE]'(?:[^'\\]|\\.|'')*'|'(?:[^']|'')*'|\$(\w*)\$.*?\$\1\$"
+                         r"|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/", re.S)
 
-def tool_query_document_rows(sql_query: str):
+def _has_statement_separator(sql: str) -> bool:
+    """True if `sql` has a `;` outside string literals, quoted identifiers and comments."""
+    return ";" in _SQL_QUOTED.sub(" ", sql)
+
+def _plan_relations(plan) -> set:
+    """Every table an EXPLAIN (FORMAT JSON) plan reads (views are already expanded to their tables)."""
+    found = set()
+    if isinstance(plan, dict):
+        if "Relation Name" in plan:
+            found.add((plan.get("Schema"), plan["Relation Name"]))
+        for v in plan.values():
+            found |= _plan_relations(v)
+    elif isinstance(plan, list):
+        for v in plan:
+            found |= _plan_relations(v)
+    return found
+
+@timed_fn("tool.query_document_rows")
+def tool_query_document_rows(sql_query: str) -> Dict[str, Any]:
+    """
+    Run an agent-written SELECT over document_rows or a typed ds_* dataset table.
+
+    The query runs in a READ ONLY transaction with SQL_STATEMENT_TIMEOUT_MS and
+    is streamed through a server-side cursor, returning at most SQL_MAX_ROWS rows.
+    Its plan may only read document_rows and the tables listed in
+    document_metadata.dataset_table; with SQL_READER_ROLE set it also runs
+    under that role, which can only SELECT from those tables.
+    """
     sql = sql_query.strip().rstrip(";")
-    if not sql.lower().startswith("select"):
+    low = sql.lower()
+    if not (low.startswith("select") or low.startswith("with")):
         raise ValueError("Only SELECT queries are allowed.")
-    if "document_rows" not in sql.lower():
-        raise ValueError("Query must target document_rows.")
-    with get_db_connection() as conn, conn.cursor() as cur:
-        cur.execute(sql)
-        cols = [c[0] for c in cur.description]
-        return [dict(zip(cols, row)) for row in cur.fetchall()]
+    if _has_statement_separator(sql):
+        raise ValueError("Only a single statement is allowed.")
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION READ ONLY")
+            cur.execute("""SELECT current_schema(), array(SELECT dataset_table FROM document_metadata
+                                                          WHERE dataset_table IS NOT NULL)""")
+            schema, tables = cur.fetchone()
+            allowed = {(schema, "document_rows")} | {(schema, t) for t in tables}
+            cur.execute("SELECT set_config('statement_timeout', %s, true)", (str(Config.SQL_STATEMENT_TIMEOUT_MS),))
+            if Config.SQL_READER_ROLE:
+                cur.execute(pgsql.SQL("SET LOCAL ROLE {}").format(pgsql.Identifier(Config.SQL_READER_ROLE)))
+            cur.execute("EXPLAIN (FORMAT JSON, VERBOSE) " + sql)
+            plan = cur.fetchone()[0]
+        if not (isinstance(plan, list) and plan and isinstance(plan[0], dict) and "Plan" in plan[0]):
+            raise ValueError("Only a single SELECT statement is allowed.")
+        denied = sorted(f"{s}.{t}" for s, t in _plan_relations(plan) - allowed)
+        if denied:
+            raise ValueError(f"Query may only read document_rows and dataset tables (ds_*), not {', '.join(denied)}.")
+        with conn.cursor(name="query_document_rows") as cur:
+            cur.itersize = min(Config.SQL_MAX_ROWS + 1, 1000)
+            cur.execute(sql)
+            rows = cur.fetchmany(Config.SQL_MAX_ROWS + 1)
+            cols = [c[0] for c in cur.description]
+    truncated = len(rows) > Config.SQL_MAX_ROWS
+    rows = rows[:Config.SQL_MAX_ROWS]
+    return {"rows": [dict(zip(cols, row)) for row in rows], "row_count": len(rows), "truncated": truncated}
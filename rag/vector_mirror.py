@@ -0,0 +1,438 @@
+"""
+Optional in-process mirror of documents.embedding for retrieval without pgvector.
+
+The mirror is a directory (VECTOR_MIRROR_DIR) of append-only segments, each
+a contiguous, unit-normalized float16/float32 matrix (`<seg>.vec`) with
+sidecar ids (`<seg>.ids`, int64), doc indexes (`<seg>.doc`, int32) and the
+doc_id strings (`<seg>.docs.json`), plus a tombstone array of deleted ids
+and `manifest.json` naming the current generation. Readers memory-map the
+files read-only, so every worker process shares one copy through the page
+cache, and they pick up a new generation when the manifest is replaced.
+
+sync() is incremental: the drive poller records which doc_ids changed at
+each corpus version (document_changes), so only those documents' ids are
+diffed and only new rows' embeddings are fetched. A single writer is
+enforced with a lock file. NumPy is optional: without it (or with
+VECTOR_MIRROR=false) rag_search simply queries Postgres.
+"""
+import json, logging, os, threading, time
+from contextlib import contextmanager
+from config import Config
+from db import get_db_connection
+
+try:
+    import numpy as np
+except ImportError:  # optional: without NumPy rag_search always queries Postgres
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: syncs are serialized within one process only
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+BLOCK_ROWS = 16384
+FETCH_ROWS = 5000
+
+
+def _parse_vector(text):
+    return np.array(text.strip("[]").split(","), dtype=np.float32)
+
+
+def _remove(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _read_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST), encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
+
+
+def _write_json(path, obj):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(obj, fh)
+    os.replace(tmp, path)
+
+
+class _Segment:
+    def __init__(self, root, meta, dtype):
+        base = os.path.join(root, meta["name"])
+        self.name, self.rows = meta["name"], meta["rows"]
+        self.vectors = np.memmap(base + ".vec", dtype=dtype, mode="r", shape=(self.rows, meta["dim"]))
+        self.ids = np.memmap(base + ".ids", dtype=np.int64, mode="r", shape=(self.rows,))
+        self.docs = np.memmap(base + ".doc", dtype=np.int32, mode="r", shape=(self.rows,))
+        with open(base + ".docs.json", encoding="utf-8") as fh:
+            self.doc_ids = json.load(fh)
+        self.alive = None  # bool mask, None = no tombstones in this segment
+
+    def doc_mask(self, doc_ids):
+        wanted = [i for i, d in enumerate(self.doc_ids) if d in doc_ids]
+        return np.isin(self.docs, wanted)
+
+
+class _SegmentWriter:
+    """Streams rows into a new segment's temp files; finish() publishes them."""
+
+    def __init__(self, root, name, dtype):
+        self.root, self.name, self.dtype = root, name, np.dtype(dtype)
+        self.rows, self.dim, self._doc_index = 0, None, {}
+        self._base = os.path.join(root, name)
+        self._files = {ext: open(self._base + ext + ".tmp", "wb") for ext in (".vec", ".ids", ".doc")}
+
+    def add(self, ids, docs, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"embedding dimension changed ({vectors.shape[1]} != {self.dim})")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self._files[".vec"].write((vectors / norms).astype(self.dtype).tobytes())
+        self._files[".ids"].write(np.asarray(ids, dtype=np.int64).tobytes())
+        idx = [self._doc_index.setdefault(d, len(self._doc_index)) for d in docs]
+        self._files[".doc"].write(np.asarray(idx, dtype=np.int32).tobytes())
+        self.rows += len(ids)
+
+    def finish(self):
+        for fh in self._files.values():
+            fh.close()
+        if not self.rows:
+            self.abort()
+            return None
+        _write_json(self._base + ".docs.json", list(self._doc_index))
+        for ext in self._files:
+            os.replace(self._base + ext + ".tmp", self._base + ext)
+        return {"name": self.name, "rows": self.rows, "dim": self.dim}
+
+    def abort(self):
+        for ext, fh in self._files.items():
+            fh.close()
+            _remove(self._base + ext + ".tmp")
+
+
+class VectorMirror:
+    """Read side: memory-mapped segments of the current generation, reloaded when it changes."""
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._state = None
+        self._manifest_mtime = None
+        self._checked = 0.0
+        self._sync_thread = None
+
+    def _load(self):
+        manifest = _read_manifest(self.root)
+        if manifest is None:
+            return None
+        dtype = np.dtype(manifest["dtype"])
+        segments = [_Segment(self.root, m, dtype) for m in manifest["segments"]]
+        deleted = np.load(os.path.join(self.root, manifest["deleted"])) if manifest.get("deleted") else None
+        if deleted is not None and deleted.size:
+            for seg in segments:
+                alive = ~np.isin(seg.ids, deleted)
+                seg.alive = None if alive.all() else alive
+        return {"manifest": manifest, "segments": segments}
+
+    def state(self):
+        now = time.monotonic()
+        if self._state is not None and now - self._checked < Config.VECTOR_MIRROR_RELOAD_SECONDS:
+            return self._state
+        with self._lock:
+            self._checked = now
+            try:
+                st = os.stat(os.path.join(self.root, MANIFEST))
+                mtime = (st.st_mtime_ns, st.st_ino)
+            except FileNotFoundError:
+                self._state, self._manifest_mtime = None, None
+                return None
+            if mtime != self._manifest_mtime:
+                try:
+                    self._state, self._manifest_mtime = self._load(), mtime
+                except (OSError, ValueError):
+                    pass  # generation swapped mid-load: keep the previous one, retry next check
+            return self._state
+
+    @property
+    def version(self):
+        state = self.state()
+        return state["manifest"]["version"] if state else None
+
+    def search(self, query, k, doc_ids=None):
+        """
+        Exact cosine top-k over all live rows, block by block (float16 blocks are
+        widened to float32 so the matmul runs in BLAS). Returns (ids, scores,
+        vectors) best first; `doc_ids` restricts the search to those documents.
+        """
+        state = self.state()
+        if state is None or k <= 0:
+            return [], [], None
+        q = np.asarray(query, dtype=np.float32)
+        if q.shape[0] != state["manifest"].get("dim"):
+            return [], [], None  # EMBEDDING_DIMENSIONS changed: Postgres serves until the next rebuild
+        q = q / (np.linalg.norm(q) or 1.0)
+        doc_ids = set(doc_ids) if doc_ids is not None else None
+        cand_ids, cand_scores, cand_vecs = [], [], []
+        for seg in state["segments"]:
+            allowed = seg.alive
+            if doc_ids is not None:
+                mask = seg.doc_mask(doc_ids)
+                allowed = mask if allowed is None else allowed & mask
+                if not allowed.any():
+                    continue
+            for start in range(0, seg.rows, BLOCK_ROWS):
+                block = np.asarray(seg.vectors[start:start + BLOCK_ROWS], dtype=np.float32)
+                scores = block @ q
+                if allowed is not None:
+                    scores[~allowed[start:start + BLOCK_ROWS]] = -np.inf
+                top = np.argpartition(-scores, k)[:k] if len(scores) > k else np.arange(len(scores))
+                top = top[np.isfinite(scores[top])]
+                cand_ids.append(seg.ids[start + top])
+                cand_scores.append(scores[top])
+                cand_vecs.append(block[top])
+        if not cand_ids:
+            return [], [], None
+        ids, scores, vecs = np.concatenate(cand_ids), np.concatenate(cand_scores), np.concatenate(cand_vecs)
+        order = np.argsort(-scores, kind="stable")[:k]
+        return ids[order].tolist(), scores[order].tolist(), vecs[order]
+
+    def note_db_version(self, version):
+        """Start a background sync when Postgres is ahead of the mirror (one per process)."""
+        current = self.version
+        if not Config.VECTOR_MIRROR_AUTOSYNC or current is None or version is None or version <= current:
+            return
+        with self._lock:
+            if self._sync_thread is not None and self._sync_thread.is_alive():
+                return
+            self._sync_thread = threading.Thread(target=self._background_sync, name="vector-mirror-sync",
+                                                 daemon=True)
+            self._sync_thread.start()
+
+    def _background_sync(self):
+        try:
+            sync(self.root, blocking=False)
+        except Exception:
+            log.exception("vector mirror background sync failed")
+
+    def stats(self):
+        state = self.state()
+        if state is None:
+            return {"ready": False}
+        m, segs = state["manifest"], state["segments"]
+        rows = sum(s.rows for s in segs)
+        dead = sum(int((~s.alive).sum()) for s in segs if s.alive is not None)
+        return {"ready": True, "version": m["version"], "generation": m["generation"], "dtype": m["dtype"],
+                "dim": m.get("dim"), "segments": len(segs), "rows": rows, "live_rows": rows - dead,
+                "bytes": sum(s.vectors.nbytes + s.ids.nbytes + s.docs.nbytes for s in segs)}
+
+
+_mirror = None
+_mirror_pid = None
+_mirror_lock = threading.Lock()
+
+
+def get_mirror(enabled=None):
+    """Process-wide mirror when enabled (default: VECTOR_MIRROR), built and NumPy is available; else None."""
+    global _mirror, _mirror_pid
+    if not (Config.VECTOR_MIRROR if enabled is None else enabled) or np is None:
+        return None
+    with _mirror_lock:
+        if _mirror is None or _mirror_pid != os.getpid():
+            _mirror, _mirror_pid = VectorMirror(Config.VECTOR_MIRROR_DIR), os.getpid()
+    return _mirror if _mirror.state() is not None else None
+
+
+def mirror_stats():
+    if not Config.VECTOR_MIRROR or np is None:
+        return {"enabled": False}
+    m = get_mirror()
+    return dict(m.stats() if m is not None else {"ready": False}, enabled=True)
+
+
+# --- sync (single writer) ----------------------------------------------------
+
+_sync_lock = threading.Lock()
+
+
+@contextmanager
+def _writer_lock(root, blocking):
+    if not _sync_lock.acquire(blocking=blocking):
+        yield False
+        return
+    try:
+        with open(os.path.join(root, ".lock"), "a") as fh:
+            locked = True
+            if fcntl is not None:
+                try:
+                    fcntl.flock(fh, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    locked = False
+            yield locked
+    finally:
+        _sync_lock.release()
+
+
+def _changed_docs(cur, since):
+    """doc_ids changed after corpus version `since`, or None if the change log doesn't reach back that far."""
+    cur.execute("SELECT min(version) FROM document_changes")
+    oldest = cur.fetchone()[0]
+    if oldest is None or oldest > since + 1:
+        return None
+    cur.execute("SELECT DISTINCT doc_id FROM document_changes WHERE version > %s", (since,))
+    return [r[0] for r in cur.fetchall()]
+
+
+def _stream_rows(conn, where, params, writer):
+    with conn.cursor(name="vector_mirror_rows") as named:
+        named.itersize = FETCH_ROWS
+        named.execute(f"""SELECT id, metadata->>'doc_id', embedding::text FROM documents
+                          WHERE embedding IS NOT NULL AND {where} ORDER BY id""", params)
+        while True:
+            rows = named.fetchmany(FETCH_ROWS)
+            if not rows:
+                break
+            writer.add([r[0] for r in rows], [r[1] or "" for r in rows], np.stack([_parse_vector(r[2]) for r in rows]))
+
+
+def _publish(root, old, segments, deleted, version, dim):
+    """Atomically switch to a new generation, then drop files the old one no longer shares."""
+    generation = (old["generation"] if old else 0) + 1
+    deleted_name = None
+    if deleted is not None and deleted.size:
+        deleted_name = f"deleted-{generation:06d}.npy"
+        with open(os.path.join(root, deleted_name + ".tmp"), "wb") as fh:
+            np.save(fh, np.unique(deleted))
+        os.replace(os.path.join(root, deleted_name + ".tmp"), os.path.join(root, deleted_name))
+    manifest = {"version": version, "generation": generation, "dtype": Config.VECTOR_MIRROR_DTYPE,
+                "dim": dim, "segments": segments, "deleted": deleted_name}
+    _write_json(os.path.join(root, MANIFEST), manifest)
+    if old:
+        keep = {s["name"] for s in segments}
+        for s in old["segments"]:
+            if s["name"] not in keep:
+                base = os.path.join(root, s["name"])
+                _remove(base + ".vec", base + ".ids", base + ".doc", base + ".docs.json")
+        if old.get("deleted") and old["deleted"] != deleted_name:
+            _remove(os.path.join(root, old["deleted"]))
+    return manifest
+
+
+def _rebuild(root, conn, old, version):
+    name = f"seg-{(old['generation'] if old else 0) + 1:06d}"
+    writer = _SegmentWriter(root, name, Config.VECTOR_MIRROR_DTYPE)
+    try:
+        _stream_rows(conn, "TRUE", (), writer)
+    except BaseException:
+        writer.abort()
+        raise
+    seg = writer.finish()
+    _publish(root, old, [seg] if seg else [], None, version, writer.dim)
+    return {"mode": "rebuild", "version": version, "rows": seg["rows"] if seg else 0}
+
+
+def _compact(root, state, version):
+    """Rewrite all live rows into one segment (drops tombstones and small segments)."""
+    old = state["manifest"]
+    writer = _SegmentWriter(root, f"seg-{old['generation'] + 1:06d}", old["dtype"])
+    try:
+        for seg in state["segments"]:
+            for start in range(0, seg.rows, BLOCK_ROWS):
+                sl = slice(start, start + BLOCK_ROWS)
+                keep = seg.alive[sl] if seg.alive is not None else slice(None)
+                ids, docs = seg.ids[sl][keep], seg.docs[sl][keep]
+                if len(ids):
+                    writer.add(ids, [seg.doc_ids[d] for d in docs], np.asarray(seg.vectors[sl][keep], dtype=np.float32))
+    except BaseException:
+        writer.abort()
+        raise
+    seg = writer.finish()
+    _publish(root, old, [seg] if seg else [], None, version, writer.dim or old.get("dim"))
+
+
+def _apply_changes(root, conn, state, version, changed):
+    old = state["manifest"]
+    with conn.cursor() as cur:
+        cur.execute("SELECT id FROM documents WHERE embedding IS NOT NULL AND metadata->>'doc_id' = ANY(%s)",
+                    (changed,))
+        current = np.array([r[0] for r in cur.fetchall()], dtype=np.int64)
+    mirrored = [np.empty(0, dtype=np.int64)]
+    for seg in state["segments"]:
+        mask = seg.doc_mask(set(changed))
+        if seg.alive is not None:
+            mask &= seg.alive
+        mirrored.append(np.asarray(seg.ids[mask]))
+    mirrored = np.concatenate(mirrored)
+    gone = np.setdiff1d(mirrored, current)
+    new = np.setdiff1d(current, mirrored)
+
+    segments = list(old["segments"])
+    dim = old.get("dim")
+    if len(new):
+        writer = _SegmentWriter(root, f"seg-{old['generation'] + 1:06d}", old["dtype"])
+        try:
+            _stream_rows(conn, "id = ANY(%s)", (new.tolist(),), writer)
+        except BaseException:
+            writer.abort()
+            raise
+        if dim is not None and writer.dim is not None and writer.dim != dim:
+            writer.abort()
+            return _rebuild(root, conn, old, version)
+        seg = writer.finish()
+        if seg:
+            segments.append(seg)
+            dim = dim or seg["dim"]
+    prev_deleted = np.load(os.path.join(root, old["deleted"])) if old.get("deleted") else np.empty(0, np.int64)
+    deleted = np.concatenate([prev_deleted, gone])
+    _publish(root, old, segments, deleted, version, dim)
+
+    total = sum(s["rows"] for s in segments)
+    if len(segments) > Config.VECTOR_MIRROR_MAX_SEGMENTS or (total and len(np.unique(deleted)) > 0.2 * total):
+        reloaded = VectorMirror(root)._load()
+        _compact(root, reloaded, version)
+        mode = "incremental+compact"
+    else:
+        mode = "incremental"
+    return {"mode": mode, "version": version, "changed_docs": len(changed), "added": int(len(new)),
+            "deleted": int(len(gone))}
+
+
+def sync(root=None, full=False, blocking=True):
+    """
+    Bring the mirror up to the current corpus version. Incremental unless
+    `full`, the mirror doesn't exist yet, the dtype setting changed, or the
+    change log no longer covers the mirror's version. Returns a summary dict.
+    """
+    if np is None:
+        raise RuntimeError("The vector mirror needs NumPy: pip install numpy")
+    root = root or Config.VECTOR_MIRROR_DIR
+    os.makedirs(root, exist_ok=True)
+    with _writer_lock(root, blocking) as locked:
+        if not locked:
+            return {"mode": "skipped", "reason": "another sync is running"}
+        state = VectorMirror(root)._load()
+        old = state["manifest"] if state else None
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                # Read the version first: rows committed meanwhile are reconciled by the next sync.
+                cur.execute("SELECT version FROM corpus_state")
+                row = cur.fetchone()
+                version = row[0] if row else 0
+                if full or old is None or old["dtype"] != Config.VECTOR_MIRROR_DTYPE:
+                    changed = None
+                elif old["version"] == version:
+                    return {"mode": "unchanged", "version": version}
+                else:
+                    changed = _changed_docs(cur, old["version"])
+            if changed is None:
+                return _rebuild(root, conn, old, version)
+            return _apply_changes(root, conn, state, version, changed)
@@ -0,0 +1,197 @@
+"""
+Storage modes for documents.embedding (VECTOR_STORAGE) and the SQL that depends on them.
+
+    full     ANN index on the float32 vectors (4 bytes per dimension)
+    halfvec  index on embedding::halfvec(dim) (2 bytes per dimension)
+    binary   index on binary_quantize(embedding)::bit(dim) (1 bit per dimension, Hamming)
+
+The table keeps the full-precision vectors: in the quantized modes
+match_documents (and the vector side of match_documents_hybrid) takes
+match_count * VECTOR_RERANK_FACTOR candidates from the quantized index and
+re-ranks them by exact cosine distance, so only the index shrinks.
+EMBEDDING_DIMENSIONS shortens the vectors themselves (text-embedding-3
+models). Needs pgvector >= 0.7 (halfvec, bit, binary_quantize, subvector).
+"""
+import re
+from config import Config
+
+MODES = ("full", "halfvec", "binary")
+DEFAULT_DIM = 1536  # text-embedding-3-small / ada-002
+INDEX_NAME = "documents_embedding_ann_idx"
+
+
+def dimensions() -> int:
+    return Config.EMBEDDING_DIMENSIONS or DEFAULT_DIM
+
+
+def index_target(storage: str, dim: int, column: str = "embedding"):
+    """(indexed expression, operator class, distance operator) for a storage mode."""
+    if storage == "full":
+        return column, "vector_cosine_ops", "<=>"
+    if storage == "halfvec":
+        return f"({column}::halfvec({dim}))", "halfvec_cosine_ops", "<=>"
+    if storage == "binary":
+        return f"(binary_quantize({column})::bit({dim}))", "bit_hamming_ops", "<~>"
+    raise ValueError(f"Unknown VECTOR_STORAGE {storage!r} (expected one of {', '.join(MODES)})")
+
+
+def candidate_count(match_count: int, storage: str = None) -> int:
+    """Index rows re-ranked for `match_count` results (hnsw.ef_search must be at least this); 0 in full mode."""
+    storage = storage or Config.VECTOR_STORAGE
+    return 0 if storage == "full" else match_count * max(1, Config.VECTOR_RERANK_FACTOR)
+
+
+def nearest_sql(storage, dim, query, limit, where="TRUE", rerank=None):
+    """
+    SELECT of (id, dist) for the `limit` rows nearest to `query` (an SQL
+    expression of type vector), best first. Quantized modes order `limit *
+    rerank` index candidates by exact distance.
+    """
+    if storage == "full":
+        return f"""SELECT d.id, d.embedding <=> {query} AS dist FROM documents d
+      WHERE {where} ORDER BY d.embedding <=> {query} LIMIT {limit}"""
+    expr, _, op = index_target(storage, dim, "d.embedding")
+    qexpr = index_target(storage, dim, query)[0]
+    rerank = max(1, Config.VECTOR_RERANK_FACTOR if rerank is None else rerank)
+    return f"""SELECT c.id, c.embedding <=> {query} AS dist FROM (
+        SELECT d.id, d.embedding FROM documents d
+        WHERE {where} ORDER BY {expr} {op} {qexpr} LIMIT ({limit}) * {rerank}
+      ) c ORDER BY dist LIMIT {limit}"""
+
+
+def _match_body(storage, dim, where):
+    if storage == "full":
+        return f"""SELECT d.id, d.content, d.metadata,
+         1 - (d.embedding <=> query_embedding) AS similarity
+  FROM documents d
+  WHERE {where}
+  ORDER BY d.embedding <=> query_embedding
+  LIMIT match_count"""
+    # Only ids and vectors for the candidates; content is read for the final rows.
+    return f"""SELECT d.id, d.content, d.metadata, 1 - n.dist AS similarity
+  FROM ({nearest_sql(storage, dim, "query_embedding", "match_count", where)}) n
+  JOIN documents d ON d.id = n.id
+  ORDER BY n.dist"""
+
+
+def functions_sql(storage: str = None, dim: int = None) -> str:
+    """match_documents and match_documents_hybrid for a storage mode and dimension."""
+    storage, dim = storage or Config.VECTOR_STORAGE, dim or dimensions()
+    where = "(filter IS NULL OR filter = '{}'::jsonb OR d.metadata @> filter)"
+    return f"""
+CREATE OR REPLACE FUNCTION match_documents(
+  query_embedding VECTOR({dim}),
+  match_count    INT,
+  filter         JSONB DEFAULT '{{}}'::jsonb
+) RETURNS TABLE (id BIGINT, content TEXT, metadata JSONB, similarity DOUBLE PRECISION)
+LANGUAGE plpgsql AS $$
+BEGIN
+  RETURN QUERY
+  {_match_body(storage, dim, where)};
+END; $$;
+
+-- Hybrid retrieval: full-text and vector candidates in one round trip,
+-- merged with weighted reciprocal rank fusion (score = sum w / (rrf_k + rank)).
+CREATE OR REPLACE FUNCTION match_documents_hybrid(
+  query_text       TEXT,
+  query_embedding  VECTOR({dim}),
+  match_count      INT,
+  filter           JSONB DEFAULT '{{}}'::jsonb,
+  full_text_weight DOUBLE PRECISION DEFAULT 1.0,
+  semantic_weight  DOUBLE PRECISION DEFAULT 1.0,
+  rrf_k            INT DEFAULT 60,
+  candidate_count  INT DEFAULT NULL
+) RETURNS TABLE (id BIGINT, content TEXT, metadata JSONB, similarity DOUBLE PRECISION, score DOUBLE PRECISION)
+LANGUAGE sql STABLE AS $$
+  WITH q AS (
+    SELECT websearch_to_tsquery('simple', query_text) AS tsq,
+           coalesce(candidate_count, match_count * 4) AS n
+  ),
+  full_text AS (
+    SELECT ft.id, row_number() OVER (ORDER BY ft.rank DESC) AS rank_ix
+    FROM (
+      SELECT d.id, ts_rank_cd(d.fts, q.tsq) AS rank
+      FROM documents d, q
+      WHERE d.fts @@ q.tsq
+        AND {where}
+      ORDER BY rank DESC
+      LIMIT (SELECT n FROM q)
+    ) ft
+  ),
+  semantic AS (
+    SELECT s.id, row_number() OVER (ORDER BY s.dist) AS rank_ix
+    FROM ({nearest_sql(storage, dim, "query_embedding", "(SELECT n FROM q)", where)}) s
+  )
+  SELECT d.id, d.content, d.metadata,
+         1 - (d.embedding <=> query_embedding) AS similarity,
+         coalesce(full_text_weight / (rrf_k + ft.rank_ix), 0.0)
+           + coalesce(semantic_weight / (rrf_k + s.rank_ix), 0.0) AS score
+  FROM full_text ft
+  FULL OUTER JOIN semantic s ON s.id = ft.id
+  JOIN documents d ON d.id = coalesce(ft.id, s.id)
+  ORDER BY score DESC
+  LIMIT match_count;
+$$;
+"""
+
+
+def column_dimensions(cur) -> int:
+    """Declared dimension of documents.embedding (pgvector stores it as the typmod)."""
+    cur.execute("""SELECT atttypmod FROM pg_attribute
+                   WHERE attrelid = 'documents'::regclass AND attname = 'embedding'""")
+    return cur.fetchone()[0]
+
+
+def current_index(cur):
+    cur.execute("SELECT indexdef FROM pg_indexes WHERE tablename='documents' AND indexname=%s", (INDEX_NAME,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def create_index(cur, method="hnsw", storage=None, dim=None, options="", concurrently=True):
+    """(Re)create the ANN index on the storage mode's expression; `options` is a WITH (...) clause or ''."""
+    expr, opclass, _ = index_target(storage or Config.VECTOR_STORAGE, dim or dimensions())
+    cc = "CONCURRENTLY " if concurrently else ""
+    cur.execute(f"DROP INDEX {cc}IF EXISTS {INDEX_NAME}")
+    cur.execute(f"CREATE INDEX {cc}{INDEX_NAME} ON documents USING {method} ({expr} {opclass}) {options}")
+
+
+def migrate(cur, storage=None, dim=None):
+    """
+    Bring a database to `storage`/`dim` (default: VECTOR_STORAGE,
+    EMBEDDING_DIMENSIONS). Existing rows are shortened in place with
+    l2_normalize(subvector(...)), which for text-embedding-3 models equals
+    requesting fewer dimensions; growing the dimension needs re-ingestion.
+    The functions are recreated, and an existing ANN index on another
+    expression is rebuilt (same method and options). Bumps the corpus version so
+    cached answers and the vector mirror are refreshed. Returns the steps taken.
+    """
+    storage, dim = storage or Config.VECTOR_STORAGE, dim or dimensions()
+    index_target(storage, dim)  # validate the mode
+    steps = []
+    current = column_dimensions(cur)
+    indexdef = current_index(cur)
+    if current > 0 and dim > current:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM documents WHERE embedding IS NOT NULL)")
+        if cur.fetchone()[0]:
+            raise ValueError(f"documents.embedding has {current} dimensions; growing to {dim} needs "
+                             "re-embedding (clear document_metadata.checksum and re-run the poller)")
+    rebuild = indexdef and (current != dim or f"{index_target(storage, dim)[1]})" not in indexdef)
+    if rebuild:
+        cur.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+    if current != dim:
+        cur.execute(f"""ALTER TABLE documents ALTER COLUMN embedding TYPE VECTOR({dim})
+                        USING l2_normalize(subvector(embedding, 1, {dim}))::vector({dim})""")
+        steps.append(f"embedding: {current} -> {dim} dimensions")
+    cur.execute(functions_sql(storage, dim))
+    steps.append(f"functions: {storage}, {dim} dimensions")
+    if rebuild:
+        method = re.search(r"USING (\w+)", indexdef).group(1)
+        options = re.search(r"WITH \(.*\)", indexdef)
+        create_index(cur, method, storage, dim, options.group(0) if options else "", concurrently=False)
+        steps.append(f"index: {method} on {index_target(storage, dim)[0]}")
+    if current != dim:
+        # The change log can't describe a whole-table rewrite: drop it so the mirror rebuilds.
+        cur.execute("DELETE FROM document_changes")
+        cur.execute("UPDATE corpus_state SET version = version + 1, updated_at = NOW()")
+    return steps
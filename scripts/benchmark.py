@@ -0,0 +1,383 @@
+# scripts/benchmark.py
+"""
+Offline benchmarks and load test (OpenAI and Drive replaced by scripts.fakes).
+
+    python -m scripts.benchmark micro                       # chunker + processors, no DB
+    python -m scripts.benchmark search --corpus-sizes 1000,10000,50000
+    python -m scripts.benchmark ingest --files 50
+    python -m scripts.benchmark load --concurrency 16 --requests 400 [--stream]
+    python -m scripts.benchmark all --json results.json
+    python -m scripts.benchmark micro --json new.json --compare results.json --tolerance 0.2
+
+`search`, `ingest` and `load` write to the configured database (rows tagged
+with the `bench-` prefix and removed afterwards): point the N8N_DB_* variables
+at a scratch database. `load` starts the Flask app in-process unless --url
+is given, in which case that server must already use the fake OpenAI
+(`python -m scripts.fakes openai`).
+
+Output is JSON: {"meta": {...}, "results": [{"name", "params", "metrics"}]}.
+With --compare, metrics ending in `_ms` that grew, or in `_per_s` that
+shrank, by more than --tolerance are reported and the exit code is 1.
+"""
+import argparse, json, math, os, platform, random, subprocess, sys, tempfile, threading, time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from config import Config
+from scripts import fakes
+
+BENCH_PREFIX = "bench-"
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def latency_stats(samples_ms):
+    s = sorted(samples_ms)
+    return {"n": len(s), "mean_ms": sum(s) / len(s) if s else 0.0, "p50_ms": percentile(s, 0.50),
+            "p95_ms": percentile(s, 0.95), "p99_ms": percentile(s, 0.99), "max_ms": s[-1] if s else 0.0}
+
+
+def measure(fn, repeat=5, warmup=1):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return latency_stats(samples)
+
+
+def result(name, params, metrics):
+    return {"name": name, "params": params, "metrics": {k: round(v, 4) if isinstance(v, float) else v
+                                                         for k, v in metrics.items()}}
+
+
+@contextmanager
+def fake_openai(latency_ms=0.0):
+    """Point this process's OpenAI calls at a FakeOpenAI for the duration."""
+    saved = Config.OPENAI_BASE_URL, Config.OPENAI_API_KEY
+    with fakes.FakeOpenAI(latency_ms=latency_ms) as fake:
+        Config.OPENAI_BASE_URL, Config.OPENAI_API_KEY = fake.base_url, Config.OPENAI_API_KEY or "fake"
+        try:
+            yield fake
+        finally:
+            Config.OPENAI_BASE_URL, Config.OPENAI_API_KEY = saved
+
+
+# --- micro -------------------------------------------------------------------
+
+def bench_micro(args):
+    from rag.chunking import chunk_text, iter_chunks
+    from rag.ingestion.processors import ColumnTypes, iter_csv_rows, iter_pdf_pages, iter_text_file
+
+    rng, out = random.Random(args.seed), []
+    for n in args.text_sizes:
+        text = fakes.synthetic_text(rng, n)
+        for name, fn in (("chunk_text", lambda: chunk_text(text, Config.CHUNK_SIZE, Config.CHUNK_OVERLAP)),
+                         ("iter_chunks", lambda: sum(1 for _ in iter_chunks(
+                             (text[i:i + 65536] for i in range(0, len(text), 65536)),
+                             Config.CHUNK_SIZE, Config.CHUNK_OVERLAP)))):
+            stats = measure(fn, args.repeat)
+            out.append(result(name, {"chars": n}, dict(stats, mb_per_s=n / 1e6 / (stats["p50_ms"] / 1000 or 1e-9))))
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as d:
+        for n in args.text_sizes:
+            path = os.path.join(d, f"text-{n}.txt")
+            with open(path, "w", encoding="utf-8") as fh:
+                fh.write(fakes.synthetic_text(rng, n))
+            stats = measure(lambda: sum(len(t) for t in iter_text_file(path)), args.repeat)
+            out.append(result("iter_text_file", {"chars": n}, stats))
+        for rows in args.csv_rows:
+            path = os.path.join(d, f"rows-{rows}.csv")
+            fakes.write_csv(path, fakes.synthetic_rows(rng, rows))
+
+            def typed_rows():
+                types = ColumnTypes()
+                sum(1 for _ in types.observe_all(iter_csv_rows(path)))
+                return types.schema()
+
+            stats = measure(typed_rows, args.repeat)
+            out.append(result("csv_rows_typed", {"rows": rows},
+                              dict(stats, rows_per_s=rows / (stats["p50_ms"] / 1000 or 1e-9))))
+        for pages in args.pdf_pages:
+            path = os.path.join(d, f"pages-{pages}.pdf")
+            fakes.write_pdf(path, [fakes.synthetic_text(rng, 4000) for _ in range(pages)])
+            stats = measure(lambda: sum(len(t) for t in iter_pdf_pages(path)), args.repeat)
+            out.append(result("iter_pdf_pages", {"pages": pages},
+                              dict(stats, pages_per_s=pages / (stats["p50_ms"] / 1000 or 1e-9))))
+    return out
+
+
+# --- search ------------------------------------------------------------------
+
+def _cleanup_db():
+    from db import get_db_connection
+    from rag.ingestion.datasets import drop_dataset
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM documents WHERE metadata->>'doc_id' LIKE %s", (BENCH_PREFIX + "%",))
+        cur.execute("SELECT id FROM document_metadata WHERE id LIKE %s", (BENCH_PREFIX + "%",))
+        for (file_id,) in cur.fetchall():
+            drop_dataset(cur, file_id)
+        cur.execute("DELETE FROM document_rows WHERE dataset_id LIKE %s", (BENCH_PREFIX + "%",))
+        cur.execute("DELETE FROM document_metadata WHERE id LIKE %s", (BENCH_PREFIX + "%",))
+        cur.execute("DELETE FROM chat_messages WHERE session_id LIKE %s", (BENCH_PREFIX + "%",))
+        cur.execute("DELETE FROM drive_sync_state WHERE folder_id LIKE %s", (BENCH_PREFIX + "%",))
+        cur.execute("DELETE FROM drive_retry WHERE folder_id LIKE %s", (BENCH_PREFIX + "%",))
+
+
+def _seed_documents(rng, start, stop, chunks_per_doc=20):
+    """Insert synthetic chunks start..stop-1 (embedded locally, no HTTP) with binary COPY."""
+    from db import get_db_connection
+    from rag.ingestion.writer import DocumentSpool
+    with get_db_connection() as conn, conn.cursor() as cur, DocumentSpool() as spool:
+        for i in range(start, stop):
+            text = fakes.synthetic_text(rng, Config.CHUNK_SIZE)
+            doc = f"{BENCH_PREFIX}doc-{i // chunks_per_doc}"
+            spool.add(text, {"doc_id": doc, "file_title": doc, "chunk_index": i % chunks_per_doc},
+                      fakes.fake_embedding(text, Config.EMBEDDING_DIMENSIONS or fakes.EMBED_DIM))
+        spool.copy_into(cur)
+        cur.execute("ANALYZE documents")
+
+
+def bench_search(args):
+    from rag import tools
+    rng, out, seeded = random.Random(args.seed), [], 0
+    queries = [fakes.synthetic_text(rng, 60) for _ in range(args.queries)]
+    _cleanup_db()
+    try:
+        with fake_openai():
+            for size in sorted(args.corpus_sizes):
+                _seed_documents(rng, seeded, size)
+                seeded = size
+                for hybrid in (False, True):
+                    for q in queries:  # warm the embedding cache: time retrieval only
+                        tools.rag_search(q, hybrid=hybrid)
+                    samples = []
+                    for q in queries:
+                        t0 = time.perf_counter()
+                        tools.rag_search(q, hybrid=hybrid)
+                        samples.append((time.perf_counter() - t0) * 1000)
+                    stats = latency_stats(samples)
+                    out.append(result("rag_search", {"bench_chunks": size, "hybrid": hybrid},
+                                      dict(stats, queries_per_s=1000 / (stats["mean_ms"] or 1e-9))))
+    finally:
+        if not args.keep:
+            _cleanup_db()
+    return out
+
+
+# --- ingest ------------------------------------------------------------------
+
+def _edit_corpus(folder):
+    """Append to one doc, delete one sheet and add a new doc (for the changes-feed pass)."""
+    names = sorted(os.listdir(folder))
+    doc = next(n for n in names if n.endswith(".txt"))
+    with open(os.path.join(folder, doc), "a", encoding="utf-8") as fh:
+        fh.write(" Appended paragraph for the incremental pass.")
+    later = time.time() + 5  # a distinct modifiedTime even on coarse-mtime filesystems
+    os.utime(os.path.join(folder, doc), (later, later))
+    os.remove(os.path.join(folder, next(n for n in names if n.endswith(".csv"))))
+    with open(os.path.join(folder, "zz-added.txt"), "w", encoding="utf-8") as fh:
+        fh.write(fakes.synthetic_text(random.Random(0), 4000))
+
+
+def bench_ingest(args):
+    from rag.ingestion import drive_poller
+    out = []
+    with tempfile.TemporaryDirectory(prefix="bench-drive-") as folder:
+        fakes.make_corpus(folder, args.files, seed=args.seed)
+        drive = fakes.FakeDrive(folder, id_prefix=BENCH_PREFIX, folder_id=BENCH_PREFIX + "folder")
+        real_drive, drive_poller._drive = drive_poller._drive, lambda: drive
+        real_folder, Config.GOOGLE_FOLDER_ID = Config.GOOGLE_FOLDER_ID, drive.folder_id
+        _cleanup_db()
+        try:
+            with fake_openai(args.openai_latency_ms), ProcessPoolExecutor(
+                    max_workers=Config.INGEST_EXTRACT_PROCESSES or None) as pool:
+                # cold: full paged listing; unchanged: empty changes feed; delta: 1 edit, 1 delete, 1 add.
+                for label in ("cold", "unchanged", "delta"):
+                    if label == "delta":
+                        _edit_corpus(folder)
+                    t0 = time.perf_counter()
+                    summary = drive_poller.poll_once(drive, pool)
+                    elapsed = time.perf_counter() - t0
+                    out.append(result("ingest", {"files": args.files, "pass": label},
+                                      {"total_ms": elapsed * 1000, "files_seen": summary["files"],
+                                       "files_per_s": summary["files"] / (elapsed or 1e-9),
+                                       "files_removed": len(summary["removed"]), "failed": summary["failed"],
+                                       "stages": summary.get("stages", {})}))
+        finally:
+            drive_poller._drive = real_drive
+            Config.GOOGLE_FOLDER_ID = real_folder
+            if not args.keep:
+                _cleanup_db()
+    return out
+
+
+# --- load --------------------------------------------------------------------
+
+def _ask(url, message, session_id, stream):
+    import requests
+    body = {"message": message, "sessionId": session_id, "stream": stream}
+    t0 = time.perf_counter()
+    first = None
+    with requests.post(f"{url}/ask", json=body, headers={"x-api-key": Config.X_API_KEY},
+                       timeout=120, stream=stream) as r:
+        if stream:
+            for line in r.iter_lines(decode_unicode=True):
+                if first is None and line and line.startswith("event: token"):
+                    first = time.perf_counter()
+                if line and line.startswith("event: error"):
+                    return r.status_code, "error", (time.perf_counter() - t0) * 1000, None
+        else:
+            r.content
+    elapsed = (time.perf_counter() - t0) * 1000
+    ok = 200 <= r.status_code < 300
+    return r.status_code, "ok" if ok else "http", elapsed, (first - t0) * 1000 if first else None
+
+
+@contextmanager
+def _local_app():
+    from werkzeug.serving import make_server
+    from app import app
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+
+
+def bench_load(args):
+    rng = random.Random(args.seed)
+    messages = [fakes.synthetic_text(rng, 80) for _ in range(args.requests + args.warmup)]
+    with fake_openai(args.openai_latency_ms) as fake, (_nullctx(args.url) if args.url else _local_app()) as url:
+        def one(i):
+            return _ask(url, messages[i], f"{BENCH_PREFIX}session-{i % args.concurrency}", args.stream)
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+            list(ex.map(one, range(args.warmup)))
+            t0 = time.perf_counter()
+            rows = list(ex.map(one, range(args.warmup, args.warmup + args.requests)))
+            wall = time.perf_counter() - t0
+        openai_calls = dict(fake.requests)
+    if not args.keep:
+        _cleanup_db()
+    ok = [r for r in rows if r[1] == "ok"]
+    metrics = latency_stats([r[2] for r in ok])
+    metrics.update(requests_per_s=len(ok) / (wall or 1e-9), errors=len(rows) - len(ok),
+                   wall_ms=wall * 1000, openai_calls=openai_calls)
+    ttft = [r[3] for r in ok if r[3] is not None]
+    if ttft:
+        metrics["ttft_p50_ms"] = latency_stats(ttft)["p50_ms"]
+        metrics["ttft_p95_ms"] = latency_stats(ttft)["p95_ms"]
+    return [result("ask_load", {"concurrency": args.concurrency, "requests": args.requests,
+                                "stream": args.stream, "openai_latency_ms": args.openai_latency_ms,
+                                "external": bool(args.url)}, metrics)]
+
+
+@contextmanager
+def _nullctx(value):
+    yield value
+
+
+# --- output ------------------------------------------------------------------
+
+def _meta():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        rev = ""
+    return {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "git": rev,
+            "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def _key(r):
+    return r["name"], json.dumps(r["params"], sort_keys=True)
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of `results` vs `baseline` beyond `tolerance` (a fraction)."""
+    base = {_key(r): r["metrics"] for r in baseline}
+    out = []
+    for r in results:
+        old = base.get(_key(r))
+        if not old:
+            continue
+        for metric, new in r["metrics"].items():
+            prev = old.get(metric)
+            if not isinstance(new, (int, float)) or not isinstance(prev, (int, float)) or not prev:
+                continue
+            if (metric.endswith("_ms") and new > prev * (1 + tolerance)) or \
+               (metric.endswith("_per_s") and new < prev * (1 - tolerance)):
+                out.append({"name": r["name"], "params": r["params"], "metric": metric,
+                            "baseline": prev, "current": new, "change": round(new / prev - 1, 4)})
+    return out
+
+
+def _ints(s):
+    return [int(x) for x in s.split(",") if x.strip()]
+
+
+BENCHES = {"micro": bench_micro, "search": bench_search, "ingest": bench_ingest, "load": bench_load}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("bench", choices=[*BENCHES, "all"])
+    ap.add_argument("--json", help="write results to this file ('-' for stdout)")
+    ap.add_argument("--compare", help="baseline results JSON to check for regressions")
+    ap.add_argument("--tolerance", type=float, default=0.2)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=5, help="micro: timed runs per case")
+    ap.add_argument("--text-sizes", type=_ints, default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--csv-rows", type=_ints, default=[1_000, 10_000])
+    ap.add_argument("--pdf-pages", type=_ints, default=[10, 100])
+    ap.add_argument("--corpus-sizes", type=_ints, default=[1_000, 10_000])
+    ap.add_argument("--queries", type=int, default=50)
+    ap.add_argument("--files", type=int, default=30, help="ingest: synthetic Drive files")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--warmup", type=int, default=10)
+    ap.add_argument("--stream", action="store_true", help="load: use SSE and report time to first token")
+    ap.add_argument("--url", help="load: existing service base URL instead of an in-process app")
+    ap.add_argument("--openai-latency-ms", type=float, default=0.0, help="simulated OpenAI latency per call")
+    ap.add_argument("--keep", action="store_true", help="keep bench- rows in the database")
+    args = ap.parse_args()
+
+    names = list(BENCHES) if args.bench == "all" else [args.bench]
+    results = []
+    for name in names:
+        print(f"[{name}] running...", file=sys.stderr)
+        results += BENCHES[name](args)
+    report = {"meta": _meta(), "results": results}
+
+    if args.json == "-":
+        print(json.dumps(report, indent=2))
+    else:
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as fh:
+                json.dump(report, fh, indent=2)
+        for r in results:
+            m = r["metrics"]
+            print(f"{r['name']:<15} {json.dumps(r['params'], sort_keys=True):<60} "
+                  f"p50={m.get('p50_ms', m.get('total_ms', 0.0)):.2f}ms p95={m.get('p95_ms', 0.0):.2f}ms "
+                  f"p99={m.get('p99_ms', 0.0):.2f}ms")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            regressions = compare(results, json.load(fh)["results"], args.tolerance)
+        for reg in regressions:
+            print(f"REGRESSION {reg['name']} {json.dumps(reg['params'], sort_keys=True)} {reg['metric']}: "
+                  f"{reg['baseline']} -> {reg['current']} ({reg['change']:+.1%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+# scripts/fakes.py
+"""
+Local stand-ins for OpenAI and Google Drive, for offline benchmarks.
+
+FakeOpenAI serves /v1/embeddings (deterministic hashed bag-of-words vectors,
+so similar texts get similar embeddings) and /v1/chat/completions (calls
+rag_search for a new question, then answers from the tool results; JSON or
+SSE, with `usage`). Point the service at it with OPENAI_BASE_URL:
+
+    python -m scripts.fakes openai --port 8099 --latency-ms 150
+    OPENAI_BASE_URL=http://127.0.0.1:8099/v1 OPENAI_API_KEY=fake python app.py
+
+FakeDrive implements the slice of the Drive v3 client the poller uses
+(paged files().list, changes().getStartPageToken/list, and get_media/
+export_media downloadable with MediaIoBaseDownload) on top of a local
+folder: *.pdf are PDFs, *.txt Google Docs, *.csv Sheets.
+make_corpus() fills such a folder with synthetic documents.
+"""
+import argparse, hashlib, json, math, os, random, re, threading, time, uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBED_DIM = 1536
+TOKEN = re.compile(r"\w+")
+
+PDF = "application/pdf"
+GDOC = "application/vnd.google-apps.document"
+GSHEET = "application/vnd.google-apps.spreadsheet"
+MIME_BY_EXT = {".pdf": PDF, ".txt": GDOC, ".csv": GSHEET}
+
+
+def fake_embedding(text, dim=EMBED_DIM):
+    """Unit-length signed feature hashing of lowercase word tokens."""
+    vec = [0.0] * dim
+    for tok in TOKEN.findall(text.lower()):
+        h = int.from_bytes(hashlib.blake2b(tok.encode("utf-8"), digest_size=8).digest(), "big")
+        vec[h % dim] += 1.0 if (h >> 32) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+def _tokens(text):
+    return max(1, len(text or "") // 4)
+
+
+def _chat_reply(messages, tools):
+    """(content, tool_calls) for the fake model: search once per question, then answer."""
+    last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+    question = messages[last_user].get("content") or "" if last_user >= 0 else ""
+    tool_results = [m for m in messages[last_user + 1:] if m.get("role") == "tool"]
+    names = {(t.get("function") or {}).get("name") for t in tools or []}
+    if not tool_results and "rag_search" in names:
+        call = {"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+                "function": {"name": "rag_search", "arguments": json.dumps({"query": question})}}
+        return None, [call]
+    context = " ".join((m.get("content") or "")[:300] for m in tool_results)
+    return f"Answer to '{question[:80]}' based on {len(tool_results)} tool result(s): {context[:400]}", None
+
+
+class _OpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeOpenAI/1.0"
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, obj):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        fake = self.server.fake
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        fake.count(self.path)
+        if fake.latency:
+            time.sleep(fake.latency)
+        if self.path.endswith("/embeddings"):
+            return self._embeddings(body)
+        if self.path.endswith("/chat/completions"):
+            return self._chat(body)
+        self._json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def _embeddings(self, body):
+        inputs = body.get("input") or []
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        dim = body.get("dimensions") or self.server.fake.dim
+        data = [{"object": "embedding", "index": i, "embedding": fake_embedding(t, dim)} for i, t in enumerate(inputs)]
+        n = sum(_tokens(t) for t in inputs)
+        self._json(200, {"object": "list", "data": data, "model": body.get("model"),
+                         "usage": {"prompt_tokens": n, "total_tokens": n}})
+
+    def _chat(self, body):
+        messages = body.get("messages") or []
+        content, calls = _chat_reply(messages, body.get("tools"))
+        prompt = sum(_tokens(m.get("content")) for m in messages)
+        completion = _tokens(content or json.dumps(calls))
+        usage = {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+        if body.get("stream"):
+            return self._chat_stream(body, content, calls, usage)
+        msg = {"role": "assistant", "content": content}
+        if calls:
+            msg["tool_calls"] = calls
+        self._json(200, {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion",
+                         "model": body.get("model"), "usage": usage,
+                         "choices": [{"index": 0, "message": msg,
+                                      "finish_reason": "tool_calls" if calls else "stop"}]})
+
+    def _chat_stream(self, body, content, calls, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send(obj):
+            self.wfile.write(f"data: {json.dumps(obj) if obj != '[DONE]' else obj}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion.chunk", "model": body.get("model")}
+        if calls:
+            deltas = [{"tool_calls": [dict(c, index=i)]} for i, c in enumerate(calls)]
+        else:
+            deltas = [{"content": w} for w in re.findall(r"\S+\s*", content)]
+        for d in deltas:
+            send(dict(base, choices=[{"index": 0, "delta": d, "finish_reason": None}]))
+        send(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "tool_calls" if calls else "stop"}]))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            send(dict(base, choices=[], usage=usage))
+        send("[DONE]")
+
+
+class FakeOpenAI:
+    """Threaded fake OpenAI HTTP server; `base_url` is what OPENAI_BASE_URL should be."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0.0, dim=EMBED_DIM):
+        self.latency, self.dim = latency_ms / 1000.0, dim
+        self._lock = threading.Lock()
+        self.requests = {}
+        self._server = ThreadingHTTPServer((host, port), _OpenAIHandler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self, path):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="fake-openai", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# --- Drive -------------------------------------------------------------------
+
+class _Response(dict):
+    def __init__(self, status, headers):
+        super().__init__(headers)
+        self.status = status
+
+
+class _FileHttp:
+    """httplib2-like transport serving one local file, honouring Range headers."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        size = os.path.getsize(self.path)
+        m = re.match(r"bytes=(\d+)-(\d+)", (headers or {}).get("range", ""))
+        if not m or size == 0:
+            with open(self.path, "rb") as fh:
+                data = fh.read()
+            return _Response(200, {"status": "200", "content-length": str(len(data))}), data
+        start, end = int(m.group(1)), min(int(m.group(2)), size - 1)
+        with open(self.path, "rb") as fh:
+            fh.seek(start)
+            data = fh.read(end - start + 1)
+        return _Response(206, {"status": "206", "content-range": f"bytes {start}-{end}/{size}"}), data
+
+
+class _MediaRequest:
+    def __init__(self, path):
+        self.uri = f"file://{path}"
+        self.headers = {}
+        self.http = _FileHttp(path)
+
+
+class _Call:
+    def __init__(self, result):
+        self._result = result
+
+    def execute(self, num_retries=0):
+        return self._result
+
+
+class _Files:
+    def __init__(self, drive):
+        self._drive = drive
+
+    def list(self, pageSize=100, pageToken=None, **kwargs):
+        files = self._drive.list_files()
+        start = int(pageToken or 0)
+        out = {"files": files[start:start + pageSize]}
+        if start + pageSize < len(files):
+            out["nextPageToken"] = str(start + pageSize)
+        return _Call(out)
+
+    def get_media(self, fileId, **kwargs):
+        return _MediaRequest(self._drive.path_of(fileId))
+
+    def export_media(self, fileId, mimeType=None, **kwargs):
+        return _MediaRequest(self._drive.path_of(fileId))
+
+
+class _Changes:
+    """changes().getStartPageToken/list; a page token is a position in the change log."""
+
+    def __init__(self, drive):
+        self._drive = drive
+
+    def getStartPageToken(self, **kwargs):
+        return _Call({"startPageToken": str(len(self._drive.scan_changes()))})
+
+    def list(self, pageToken, pageSize=100, **kwargs):
+        changes = self._drive.scan_changes()
+        start = int(pageToken)
+        out = {"changes": changes[start:start + pageSize]}
+        if start + pageSize < len(changes):
+            out["nextPageToken"] = str(start + pageSize)
+        else:
+            out["newStartPageToken"] = str(len(changes))
+        return _Call(out)
+
+
+class FakeDrive:
+    """
+    Drive v3 client stand-in over a local folder (file id = id_prefix + sha1 of
+    the name). The changes feed is derived by diffing the folder against the
+    previous scan, so adding, editing or deleting local files shows up as
+    Drive changes.
+    """
+
+    def __init__(self, folder, id_prefix="fake-", folder_id="fake-folder"):
+        self.folder, self.id_prefix, self.folder_id = folder, id_prefix, folder_id
+        self._changes, self._seen = [], {}
+        self._lock = threading.Lock()
+
+    def file_id(self, name):
+        return self.id_prefix + hashlib.sha1(name.encode("utf-8")).hexdigest()[:16]
+
+    def list_files(self):
+        out = []
+        for name in sorted(os.listdir(self.folder)):
+            mime = MIME_BY_EXT.get(os.path.splitext(name)[1].lower())
+            if mime is None:
+                continue
+            path = os.path.join(self.folder, name)
+            modified = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+            f = {"id": self.file_id(name), "name": name, "mimeType": mime, "parents": [self.folder_id],
+                 "webViewLink": f"file://{path}", "modifiedTime": modified.isoformat().replace("+00:00", "Z")}
+            if mime == PDF:  # Drive only reports md5Checksum for binary files
+                with open(path, "rb") as fh:
+                    f["md5Checksum"] = hashlib.md5(fh.read()).hexdigest()
+            out.append(f)
+        return out
+
+    def scan_changes(self):
+        """Append a change per file added, modified or removed since the last scan; returns the full log."""
+        with self._lock:
+            current = {f["id"]: f for f in self.list_files()}
+            for file_id, f in current.items():
+                if self._seen.get(file_id) != (f["modifiedTime"], f.get("md5Checksum")):
+                    self._changes.append({"kind": "drive#change", "changeType": "file", "fileId": file_id,
+                                          "removed": False, "file": f})
+            for file_id in self._seen.keys() - current.keys():
+                self._changes.append({"kind": "drive#change", "changeType": "file", "fileId": file_id,
+                                      "removed": True})
+            self._seen = {file_id: (f["modifiedTime"], f.get("md5Checksum")) for file_id, f in current.items()}
+            return list(self._changes)
+
+    def path_of(self, file_id):
+        for name in os.listdir(self.folder):
+            if self.file_id(name) == file_id:
+                return os.path.join(self.folder, name)
+        raise FileNotFoundError(file_id)
+
+    def files(self):
+        return _Files(self)
+
+    def changes(self):
+        return _Changes(self)
+
+
+# --- Synthetic corpus --------------------------------------------------------
+
+WORDS = ("invoice order customer shipment warehouse payment refund contract supplier quarter revenue "
+         "budget forecast roadmap release policy employee onboarding security incident report audit "
+         "inventory product pricing discount region marketing campaign support ticket escalation").split()
+
+
+def synthetic_text(rng, n_chars):
+    parts, size = [], 0
+    while size < n_chars:
+        words = [rng.choice(WORDS) for _ in range(rng.randint(6, 16))]
+        if rng.random() < 0.3:
+            words.insert(rng.randrange(len(words)), f"{rng.choice(['INV', 'SKU', 'PO'])}-{rng.randint(10000, 99999)}")
+        s = " ".join(words) + ". "
+        s = s[0].upper() + s[1:]
+        parts.append(s)
+        size += len(s)
+    return "".join(parts)[:n_chars]
+
+
+def synthetic_rows(rng, n_rows):
+    for i in range(n_rows):
+        yield {"Order ID": f"PO-{10000 + i}", "Customer": rng.choice(WORDS).title(),
+               "Amount": f"{rng.uniform(5, 5000):.2f}", "Quantity": str(rng.randint(1, 50)),
+               "Order Date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+               "Paid": rng.choice(["true", "false"])}
+
+
+def _pdf_escape(s):
+    return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages, line_chars=90, lines_per_page=50):
+    """Minimal valid text PDF (Helvetica), one string of text per page."""
+    objs = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        lines = [text[i:i + line_chars] for i in range(0, len(text), line_chars)][:lines_per_page]
+        stream = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({_pdf_escape(l)}) Tj T*" for l in lines) + " ET"
+        stream = stream.encode("latin-1", errors="replace")
+        objs.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objs.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                    b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objs)))
+        kids.append(len(objs))
+    objs[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{k} 0 R" for k in kids).encode(), len(kids))
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for i, body in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (i, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    with open(path, "wb") as fh:
+        fh.write(out)
+
+
+def write_csv(path, rows):
+    import csv
+    rows = list(rows)
+    with open(path, "w", encoding="utf-8", newline="") as fh:
+        w = csv.DictWriter(fh, fieldnames=list(rows[0]) if rows else [])
+        w.writeheader()
+        w.writerows(rows)
+
+
+def make_corpus(folder, n_files, seed=0, doc_chars=20000, pdf_pages=8, csv_rows=500):
+    """Fill `folder` with a deterministic mix of docs (60%), PDFs (25%) and sheets (15%)."""
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    for i in range(n_files):
+        r = rng.random()
+        if r < 0.6:
+            with open(os.path.join(folder, f"doc-{i:05d}.txt"), "w", encoding="utf-8") as fh:
+                fh.write(synthetic_text(rng, doc_chars))
+        elif r < 0.85:
+            write_pdf(os.path.join(folder, f"report-{i:05d}.pdf"),
+                      [synthetic_text(rng, 4000) for _ in range(pdf_pages)])
+        else:
+            write_csv(os.path.join(folder, f"sheet-{i:05d}.csv"), synthetic_rows(rng, csv_rows))
+    return folder
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    o = sub.add_parser("openai", help="serve the fake OpenAI API")
+    o.add_argument("--host", default="127.0.0.1")
+    o.add_argument("--port", type=int, default=8099)
+    o.add_argument("--latency-ms", type=float, default=0.0)
+    c = sub.add_parser("corpus", help="write a synthetic Drive folder")
+    c.add_argument("folder")
+    c.add_argument("--files", type=int, default=50)
+    c.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    if args.cmd == "corpus":
+        make_corpus(args.folder, args.files, seed=args.seed)
+        print(f"Wrote {args.files} files to {args.folder}")
+        return
+    fake = FakeOpenAI(args.host, args.port, args.latency_ms).start()
+    print(f"Fake OpenAI at {fake.base_url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# scripts/hybrid_benchmark.py
+"""
+Compare hit rate and latency of vector-only vs hybrid rag_search.
+
+A "hit" means a chunk of the expected document is in the top-K results.
+Queries come from a JSONL file ({"query": ..., "doc_id": ...} per line) or,
+by default, are sampled from the corpus: an identifier-like token (contains
+a digit, e.g. a SKU or invoice number) taken from a random chunk, expected to
+retrieve that chunk's document.
+
+    python -m scripts.hybrid_benchmark --sample 50
+    python -m scripts.hybrid_benchmark --queries eval.jsonl --json
+"""
+import argparse, json, random, re, statistics, time
+from db import get_db_connection
+from rag import tools
+
+IDENTIFIER = re.compile(r"\b(?=\w*\d)[\w-]{4,}\b")
+
+
+def sample_queries(n):
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("""SELECT content, metadata->>'doc_id' FROM documents
+                       WHERE content ~ '[0-9]' ORDER BY random() LIMIT %s""", (n * 4,))
+        rows = cur.fetchall()
+    out = []
+    for content, doc_id in rows:
+        ids = IDENTIFIER.findall(content or "")
+        if ids and doc_id:
+            out.append({"query": random.choice(ids), "doc_id": doc_id})
+        if len(out) >= n:
+            break
+    return out
+
+
+def run(queries, hybrid):
+    hits, latencies = 0, []
+    for q in queries:
+        tools.rag_search(q["query"], hybrid=hybrid)  # warm the embedding cache: time retrieval, not OpenAI
+        t0 = time.perf_counter()
+        rows = tools.rag_search(q["query"], hybrid=hybrid)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        hits += any((r.get("metadata") or {}).get("doc_id") == q["doc_id"] for r in rows)
+    latencies.sort()
+    return {
+        "mode": "hybrid" if hybrid else "vector",
+        "queries": len(queries),
+        "hit_rate": hits / len(queries) if queries else 0.0,
+        "p50_ms": statistics.median(latencies) if latencies else 0.0,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--queries", help="JSONL file with {query, doc_id} per line")
+    ap.add_argument("--sample", type=int, default=50)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as fh:
+            queries = [json.loads(line) for line in fh if line.strip()]
+    else:
+        queries = sample_queries(args.sample)
+    results = [run(queries, hybrid=False), run(queries, hybrid=True)]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(f"{r['mode']:<7} n={r['queries']} hit@{tools.TOP_K}={r['hit_rate']:.3f} "
+              f"p50={r['p50_ms']:.2f}ms p95={r['p95_ms']:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,12 +7,18 @@ ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT))
 load_dotenv(ROOT / ".env")
 
+from psycopg2 import sql  # noqa: E402
+from rag import vector_storage  # noqa: E402  (needs ROOT on sys.path)
+
 DB_NAME = os.getenv("N8N_DB_NAME")
 DB_USER = os.getenv("N8N_DB_USER")
 DB_PASS = os.getenv("N8N_DB_PASSWORD")
 DB_HOST = os.getenv("N8N_DB_HOST")
 DB_PORT = os.getenv("N8N_DB_PORT", "5432")
 
+# Optional role for query_document_rows: may only SELECT document_rows and the ds_* tables
+SQL_READER_ROLE = os.getenv("SQL_READER_ROLE", "").strip()
+
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
 DDL = """
@@ -25,30 +31,32 @@ CREATE TABLE IF NOT EXISTS documents (
   embedding VECTOR(1536)
 );
 
-CREATE OR REPLACE FUNCTION match_documents(
-  query_embedding VECTOR(1536),
-  match_count    INT,
-  filter         JSONB DEFAULT '{}'::jsonb
-) RETURNS TABLE (id BIGINT, content TEXT, metadata JSONB, similarity DOUBLE PRECISION)
-LANGUAGE plpgsql AS $$
-BEGIN
-  RETURN QUERY
-  SELECT d.id, d.content, d.metadata,
-         1 - (d.embedding <=> query_embedding) AS similarity
-  FROM documents d
-  WHERE (filter IS NULL OR filter = '{}'::jsonb OR d.metadata @> filter)
-  ORDER BY d.embedding <=> query_embedding
-  LIMIT match_count;
-END; $$;
+-- Per-document, chunk-ordered access (get_file_contents, incremental ingestion)
+CREATE INDEX IF NOT EXISTS documents_doc_chunk_idx
+  ON documents ((metadata->>'doc_id'), ((metadata->>'chunk_index')::int));
+
+-- Lexical side of hybrid search: 'simple' config keeps SKUs, invoice numbers and names intact.
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS fts TSVECTOR
+  GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED;
+CREATE INDEX IF NOT EXISTS documents_fts_idx ON documents USING GIN (fts);
 
 CREATE TABLE IF NOT EXISTS document_metadata (
   id TEXT PRIMARY KEY,
   title TEXT,
   url TEXT,
   created_at TIMESTAMP DEFAULT NOW(),
-  schema TEXT
+  schema TEXT,
+  modified_time TEXT,
+  checksum TEXT
 );
 
+-- Change tracking for incremental Drive ingestion (idempotent for existing DBs)
+ALTER TABLE document_metadata ADD COLUMN IF NOT EXISTS modified_time TEXT;
+ALTER TABLE document_metadata ADD COLUMN IF NOT EXISTS checksum TEXT;
+-- Typed spreadsheet datasets: inferred [{column, source, type}] + materialized ds_* table
+ALTER TABLE document_metadata ADD COLUMN IF NOT EXISTS typed_schema JSONB;
+ALTER TABLE document_metadata ADD COLUMN IF NOT EXISTS dataset_table TEXT;
+
 CREATE TABLE IF NOT EXISTS document_rows (
   id SERIAL PRIMARY KEY,
   dataset_id TEXT REFERENCES document_metadata(id),
@@ -62,11 +70,78 @@ CREATE TABLE IF NOT EXISTS chat_messages (
   content TEXT NOT NULL,
   created_at TIMESTAMPTZ DEFAULT NOW()
 );
+CREATE INDEX IF NOT EXISTS chat_messages_session_created_idx
+  ON chat_messages (session_id, created_at DESC, id DESC);
+
+-- Corpus version: bumped by the Drive poller whenever it changes documents/rows,
+-- so cached answers from an older corpus are never served.
+CREATE TABLE IF NOT EXISTS corpus_state (
+  id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+  version BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+INSERT INTO corpus_state (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;
+
+-- Which documents changed at each corpus version (lets the vector mirror sync incrementally)
+CREATE TABLE IF NOT EXISTS document_changes (
+  version BIGINT NOT NULL,
+  doc_id TEXT NOT NULL,
+  created_at TIMESTAMPTZ DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS document_changes_version_idx ON document_changes (version);
+
+-- Drive changes feed position per folder (drive_poller reads only deltas after the first full listing)
+CREATE TABLE IF NOT EXISTS drive_sync_state (
+  folder_id TEXT PRIMARY KEY,
+  start_page_token TEXT NOT NULL,
+  updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Files that failed a poll pass (as listed then): retried on their own while the page token moves on
+CREATE TABLE IF NOT EXISTS drive_retry (
+  folder_id TEXT NOT NULL,
+  file_id TEXT NOT NULL,
+  file JSONB NOT NULL,
+  attempts INT NOT NULL DEFAULT 1,
+  last_error TEXT,
+  updated_at TIMESTAMPTZ DEFAULT NOW(),
+  PRIMARY KEY (folder_id, file_id)
+);
+
+-- Query/chunk embedding cache (used when EMBED_CACHE_DB=true)
+CREATE TABLE IF NOT EXISTS embedding_cache (
+  model TEXT NOT NULL,
+  text_hash TEXT NOT NULL,
+  embedding REAL[] NOT NULL,
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  PRIMARY KEY (model, text_hash)
+);
 """
 
 with psycopg2.connect(DATABASE_URL) as conn:
     conn.autocommit = True
     with conn.cursor() as cur:
         cur.execute(DDL)
+        # match_documents / match_documents_hybrid depend on VECTOR_STORAGE and EMBEDDING_DIMENSIONS.
+        dim, current = vector_storage.dimensions(), vector_storage.column_dimensions(cur)
+        cur.execute("SELECT EXISTS (SELECT 1 FROM documents)")
+        if current != dim and not cur.fetchone()[0]:
+            vector_storage.migrate(cur)  # empty table: just change the column type
+        else:
+            cur.execute(vector_storage.functions_sql(dim=current if current > 0 else dim))
+            if current != dim:
+                print(f"⚠️  documents.embedding has {current} dimensions, EMBEDDING_DIMENSIONS wants {dim}: "
+                      "run `python -m scripts.vector_index migrate`.")
+        if SQL_READER_ROLE:
+            role = sql.Identifier(SQL_READER_ROLE)
+            cur.execute("SELECT 1 FROM pg_roles WHERE rolname=%s", (SQL_READER_ROLE,))
+            if not cur.fetchone():
+                cur.execute(sql.SQL("CREATE ROLE {} NOLOGIN").format(role))
+            # The app's user must be a member to SET ROLE to it.
+            cur.execute(sql.SQL("GRANT {} TO CURRENT_USER").format(role))
+            cur.execute(sql.SQL("GRANT SELECT ON document_rows TO {}").format(role))
+            cur.execute("SELECT dataset_table FROM document_metadata WHERE dataset_table IS NOT NULL")
+            for (table,) in cur.fetchall():
+                cur.execute(sql.SQL("GRANT SELECT ON {} TO {}").format(sql.Identifier(table), role))
 
 print("✅ Database initialized (pgvector + tables + match_documents).")
@@ -0,0 +1,269 @@
+# scripts/vector_index.py
+"""
+Manage the ANN index on documents.embedding and measure recall vs latency.
+
+    python -m scripts.vector_index create --method hnsw --m 16 --ef-construction 64
+    python -m scripts.vector_index create --method ivfflat --lists 200
+    python -m scripts.vector_index create --storage binary    # index on the quantized expression
+    python -m scripts.vector_index rebuild
+    python -m scripts.vector_index drop
+    python -m scripts.vector_index report --sample 50 --k 10 --ef-search 20,40,80,160
+    python -m scripts.vector_index report --probes 1,5,10,20 --json
+    python -m scripts.vector_index storage-report --modes full,halfvec,binary --dimensions 768,512
+    python -m scripts.vector_index migrate [--storage halfvec] [--dimensions 512]
+
+Storage modes and EMBEDDING_DIMENSIONS are described in rag/vector_storage.py.
+"""
+import argparse, json, math, statistics, time
+import psycopg2
+from config import Config
+from rag import vector_storage
+from rag.vector_storage import INDEX_NAME, current_index as _current_index
+
+
+def _connect():
+    conn = psycopg2.connect(Config.DATABASE_URL())
+    conn.autocommit = True  # CREATE/DROP INDEX CONCURRENTLY can't run in a transaction
+    return conn
+
+
+def _index_options(cur, method, m=16, ef_construction=64, lists=None):
+    if method == "hnsw":
+        return f"WITH (m = {int(m)}, ef_construction = {int(ef_construction)})"
+    if method == "ivfflat":
+        if not lists:
+            # pgvector guidance: rows/1000 up to 1M rows, sqrt(rows) above.
+            cur.execute("SELECT count(*) FROM documents")
+            n = cur.fetchone()[0]
+            lists = max(1, n // 1000) if n <= 1_000_000 else int(math.sqrt(n))
+        return f"WITH (lists = {int(lists)})"
+    raise ValueError(f"Unknown index method: {method}")
+
+
+def create_index(cur, method="hnsw", m=16, ef_construction=64, lists=None, maintenance_work_mem=None,
+                 storage=None):
+    if maintenance_work_mem:
+        cur.execute("SELECT set_config('maintenance_work_mem', %s, false)", (maintenance_work_mem,))
+    opts = _index_options(cur, method, m, ef_construction, lists)
+    vector_storage.create_index(cur, method, storage, vector_storage.column_dimensions(cur), opts)
+
+
+def _sample_queries(cur, n):
+    cur.execute("""SELECT embedding::text FROM documents WHERE embedding IS NOT NULL
+                   ORDER BY random() LIMIT %s""", (n,))
+    return [r[0] for r in cur.fetchall()]
+
+
+def _search(cur, vec, k, settings):
+    cur.execute("BEGIN")
+    for name, value in settings.items():
+        cur.execute("SELECT set_config(%s, %s, true)", (name, str(value)))
+    t0 = time.perf_counter()
+    cur.execute("SELECT id FROM match_documents(%s::vector, %s, '{}'::jsonb)", (vec, k))
+    ids = [r[0] for r in cur.fetchall()]
+    elapsed = (time.perf_counter() - t0) * 1000
+    cur.execute("COMMIT")
+    return ids, elapsed
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))] if values else 0.0
+
+
+def recall_report(cur, sample=50, k=10, ef_search=(), probes=()):
+    """Compare ANN results with the exact scan on `sample` stored embeddings."""
+    queries = _sample_queries(cur, sample)
+    exact_off = {"enable_indexscan": "off", "enable_bitmapscan": "off"}
+    exact = [_search(cur, q, k, exact_off) for q in queries]
+    runs = [("hnsw.ef_search", v) for v in ef_search] + [("ivfflat.probes", v) for v in probes]
+    if not runs:
+        runs = [(None, None)]
+    report = {
+        "index": _current_index(cur),
+        "sample": len(queries),
+        "k": k,
+        "exact": {"p50_ms": _pct([e for _, e in exact], 50), "p95_ms": _pct([e for _, e in exact], 95)},
+        "ann": [],
+    }
+    for name, value in runs:
+        settings = {name: value} if name else {}
+        recalls, latencies = [], []
+        for q, (truth, _) in zip(queries, exact):
+            ids, ms = _search(cur, q, k, settings)
+            recalls.append(len(set(ids) & set(truth)) / max(1, len(truth)))
+            latencies.append(ms)
+        report["ann"].append({
+            "setting": f"{name}={value}" if name else "default",
+            "recall": statistics.mean(recalls) if recalls else 0.0,
+            "p50_ms": _pct(latencies, 50),
+            "p95_ms": _pct(latencies, 95),
+        })
+    return report
+
+
+def _timed_ids(cur, query, params, settings=None):
+    cur.execute("BEGIN")
+    for name, value in (settings or {}).items():
+        cur.execute("SELECT set_config(%s, %s, true)", (name, str(value)))
+    t0 = time.perf_counter()
+    cur.execute(query, params)
+    ids = [r[0] for r in cur.fetchall()]
+    elapsed = (time.perf_counter() - t0) * 1000
+    cur.execute("COMMIT")
+    return ids, elapsed
+
+
+def _summary(queries, truth, run):
+    recalls, latencies = [], []
+    for q, expected in zip(queries, truth):
+        ids, ms = run(q)
+        recalls.append(len(set(ids) & set(expected)) / max(1, len(expected)))
+        latencies.append(ms)
+    return {"recall": statistics.mean(recalls) if recalls else 0.0,
+            "p50_ms": _pct(latencies, 50), "p95_ms": _pct(latencies, 95)}
+
+
+def storage_report(cur, modes=vector_storage.MODES, dimensions=(), sample=50, k=10, method="hnsw",
+                   rerank=None, keep=False):
+    """
+    Memory saved vs recall lost. For each storage mode a scratch ANN index is
+    built on its expression and sized, then searched with re-ranking; for
+    each reduced dimension, exact search on shortened vectors. Recall@k is
+    measured against the exact full-precision scan on `sample` stored embeddings.
+    """
+    dim = vector_storage.column_dimensions(cur)
+    rerank = rerank or Config.VECTOR_RERANK_FACTOR
+    queries = _sample_queries(cur, sample)
+    exact_off = {"enable_indexscan": "off", "enable_bitmapscan": "off"}
+    truth = [_search(cur, q, k, exact_off)[0] for q in queries]
+    cur.execute("SELECT count(*), coalesce(sum(pg_column_size(embedding)), 0) FROM documents")
+    rows, column_bytes = cur.fetchone()
+    report = {"rows": rows, "dimensions": dim, "k": k, "sample": len(queries), "method": method,
+              "rerank_factor": rerank, "embedding_column_bytes": column_bytes, "storage": [], "reduced": []}
+
+    for mode in modes:
+        expr, opclass, _ = vector_storage.index_target(mode, dim)
+        name = f"documents_embedding_{mode}_report_idx"
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        t0 = time.perf_counter()
+        cur.execute(f"CREATE INDEX CONCURRENTLY {name} ON documents USING {method} ({expr} {opclass}) "
+                    f"{_index_options(cur, method)}")
+        build_s = time.perf_counter() - t0
+        try:
+            cur.execute("SELECT pg_relation_size(%s::regclass)", (name,))
+            size = cur.fetchone()[0]
+            sql = vector_storage.nearest_sql(mode, dim, "%(q)s::vector", "%(k)s", rerank=rerank)
+            candidates = k if mode == "full" else k * rerank
+            settings = {"hnsw.ef_search": max(40, candidates)} if method == "hnsw" else {}
+            stats = _summary(queries, truth, lambda q: _timed_ids(cur, sql, {"q": q, "k": k}, settings))
+        finally:
+            if not keep:
+                cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        report["storage"].append(dict(stats, mode=mode, index_bytes=size, build_s=build_s))
+
+    full = next((r["index_bytes"] for r in report["storage"] if r["mode"] == "full"), None)
+    for r in report["storage"]:
+        r["index_saved"] = 1 - r["index_bytes"] / full if full else None
+
+    for d in dimensions:
+        if d >= dim:
+            continue
+        short = f"l2_normalize(subvector(%(q)s::vector, 1, {int(d)}))"
+        sql = f"""SELECT id FROM documents WHERE embedding IS NOT NULL
+                  ORDER BY l2_normalize(subvector(embedding, 1, {int(d)})) <=> {short} LIMIT %(k)s"""
+        stats = _summary(queries, truth, lambda q: _timed_ids(cur, sql, {"q": q, "k": k}))
+        report["reduced"].append(dict(stats, dimensions=d, vector_saved=1 - d / dim))
+    return report
+
+
+def _ints(s):
+    return [int(x) for x in s.split(",") if x.strip()] if s else []
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("create", help="(re)create the ANN index")
+    c.add_argument("--method", choices=["hnsw", "ivfflat"], default="hnsw")
+    c.add_argument("--m", type=int, default=16)
+    c.add_argument("--ef-construction", type=int, default=64)
+    c.add_argument("--lists", type=int, default=None, help="ivfflat lists (default: derived from row count)")
+    c.add_argument("--maintenance-work-mem", default=None, help="e.g. 1GB; speeds up builds")
+    c.add_argument("--storage", choices=vector_storage.MODES, default=None, help="default: VECTOR_STORAGE")
+    sub.add_parser("rebuild", help="REINDEX the existing ANN index (e.g. after bulk loads)")
+    sub.add_parser("drop", help="drop the ANN index (exact scans only)")
+    r = sub.add_parser("report", help="recall-vs-latency against the exact scan")
+    r.add_argument("--sample", type=int, default=50)
+    r.add_argument("--k", type=int, default=10)
+    r.add_argument("--ef-search", default="", help="comma-separated hnsw.ef_search values")
+    r.add_argument("--probes", default="", help="comma-separated ivfflat.probes values")
+    r.add_argument("--json", action="store_true")
+    st = sub.add_parser("storage-report", help="index size and recall per storage mode / reduced dimension")
+    st.add_argument("--modes", default=",".join(vector_storage.MODES))
+    st.add_argument("--dimensions", default="", help="comma-separated reduced dimensions to evaluate")
+    st.add_argument("--method", choices=["hnsw", "ivfflat"], default="hnsw")
+    st.add_argument("--rerank-factor", type=int, default=None, help="default: VECTOR_RERANK_FACTOR")
+    st.add_argument("--sample", type=int, default=50)
+    st.add_argument("--k", type=int, default=10)
+    st.add_argument("--keep", action="store_true", help="keep the scratch indexes")
+    st.add_argument("--json", action="store_true")
+    mg = sub.add_parser("migrate", help="apply VECTOR_STORAGE / EMBEDDING_DIMENSIONS to existing rows")
+    mg.add_argument("--storage", choices=vector_storage.MODES, default=None, help="default: VECTOR_STORAGE")
+    mg.add_argument("--dimensions", type=int, default=None, help="default: EMBEDDING_DIMENSIONS")
+    args = ap.parse_args()
+
+    with _connect() as conn, conn.cursor() as cur:
+        if args.cmd == "create":
+            create_index(cur, args.method, args.m, args.ef_construction, args.lists, args.maintenance_work_mem,
+                         args.storage)
+            print("✅ Created:", _current_index(cur))
+        elif args.cmd == "migrate":
+            cur.execute("BEGIN")
+            steps = vector_storage.migrate(cur, args.storage, args.dimensions)
+            cur.execute("COMMIT")
+            for step in steps:
+                print("✅", step)
+            print("Set VECTOR_STORAGE / EMBEDDING_DIMENSIONS in .env to match before restarting the API and poller.")
+        elif args.cmd == "storage-report":
+            modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+            report = storage_report(cur, modes, _ints(args.dimensions), args.sample, args.k, args.method,
+                                    args.rerank_factor, args.keep)
+            if args.json:
+                print(json.dumps(report, indent=2))
+                return
+            mb = 1024 * 1024
+            print(f"rows={report['rows']} dimensions={report['dimensions']} k={report['k']} "
+                  f"sample={report['sample']} rerank={report['rerank_factor']}x "
+                  f"embedding column={report['embedding_column_bytes'] / mb:.1f}MB")
+            for row in report["storage"]:
+                saved = f"{row['index_saved']:.0%}" if row["index_saved"] is not None else "n/a"
+                print(f"{row['mode']:<8} {report['method']} index={row['index_bytes'] / mb:.1f}MB "
+                      f"saved={saved} recall@{report['k']}={row['recall']:.3f} "
+                      f"p50={row['p50_ms']:.2f}ms p95={row['p95_ms']:.2f}ms build={row['build_s']:.1f}s")
+            for row in report["reduced"]:
+                print(f"dims={row['dimensions']:<5} exact recall@{report['k']}={row['recall']:.3f} "
+                      f"vector saved={row['vector_saved']:.0%} p50={row['p50_ms']:.2f}ms")
+        elif args.cmd == "rebuild":
+            if not _current_index(cur):
+                raise SystemExit("No ANN index to rebuild; use `create` first.")
+            cur.execute(f"REINDEX INDEX CONCURRENTLY {INDEX_NAME}")
+            print("✅ Rebuilt:", _current_index(cur))
+        elif args.cmd == "drop":
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}")
+            print("✅ Dropped", INDEX_NAME)
+        else:
+            report = recall_report(cur, args.sample, args.k, _ints(args.ef_search), _ints(args.probes))
+            if args.json:
+                print(json.dumps(report, indent=2))
+                return
+            print("index:", report["index"] or "(none - exact scan)")
+            print(f"sample={report['sample']} k={report['k']} exact p50={report['exact']['p50_ms']:.2f}ms "
+                  f"p95={report['exact']['p95_ms']:.2f}ms")
+            for row in report["ann"]:
+                print(f"{row['setting']:<22} recall@{report['k']}={row['recall']:.3f} "
+                      f"p50={row['p50_ms']:.2f}ms p95={row['p95_ms']:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
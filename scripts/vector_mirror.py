@@ -0,0 +1,78 @@
+# scripts/vector_mirror.py
+"""
+Build and inspect the in-process vector mirror (VECTOR_MIRROR_DIR) and
+compare it with match_documents.
+
+    python -m scripts.vector_mirror sync
+    python -m scripts.vector_mirror rebuild
+    python -m scripts.vector_mirror stats
+    python -m scripts.vector_mirror check --sample 50 --k 10 [--json]
+"""
+import argparse, json, time
+import psycopg2
+from config import Config
+from rag import vector_mirror
+from scripts.vector_index import _pct, _sample_queries, _search
+
+
+def check(sample=50, k=10):
+    """recall@k of the mirror against pgvector's exact scan, with latencies of both."""
+    mirror = vector_mirror.VectorMirror(Config.VECTOR_MIRROR_DIR)
+    if mirror.state() is None:
+        raise SystemExit("No mirror yet; run `sync` first.")
+    conn = psycopg2.connect(Config.DATABASE_URL())
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            queries = _sample_queries(cur, sample)
+            exact_off = {"enable_indexscan": "off", "enable_bitmapscan": "off"}
+            recalls, db_ms, mirror_ms = [], [], []
+            for q in queries:
+                truth, ms = _search(cur, q, k, exact_off)
+                db_ms.append(ms)
+                vec = vector_mirror._parse_vector(q)
+                t0 = time.perf_counter()
+                ids, _, _ = mirror.search(vec, k)
+                mirror_ms.append((time.perf_counter() - t0) * 1000)
+                recalls.append(len(set(ids) & set(truth)) / max(1, len(truth)))
+    finally:
+        conn.close()
+    return {
+        "mirror": mirror.stats(),
+        "sample": len(queries),
+        "k": k,
+        "recall": sum(recalls) / len(recalls) if recalls else 0.0,
+        "postgres_exact": {"p50_ms": _pct(db_ms, 50), "p95_ms": _pct(db_ms, 95)},
+        "mirror_search": {"p50_ms": _pct(mirror_ms, 50), "p95_ms": _pct(mirror_ms, 95)},
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("sync", help="apply changes since the mirror's corpus version")
+    sub.add_parser("rebuild", help="rewrite the mirror from all of documents.embedding")
+    sub.add_parser("stats", help="rows, segments, size and version of the current mirror")
+    c = sub.add_parser("check", help="recall and latency against the exact pgvector scan")
+    c.add_argument("--sample", type=int, default=50)
+    c.add_argument("--k", type=int, default=10)
+    c.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    if args.cmd in ("sync", "rebuild"):
+        print("✅", vector_mirror.sync(full=args.cmd == "rebuild"))
+    elif args.cmd == "stats":
+        print(json.dumps(vector_mirror.VectorMirror(Config.VECTOR_MIRROR_DIR).stats(), indent=2))
+    else:
+        report = check(args.sample, args.k)
+        if args.json:
+            print(json.dumps(report, indent=2))
+            return
+        print(f"sample={report['sample']} recall@{report['k']}={report['recall']:.3f} "
+              f"rows={report['mirror'].get('live_rows')} dtype={report['mirror'].get('dtype')}")
+        for name in ("postgres_exact", "mirror_search"):
+            print(f"{name:<16} p50={report[name]['p50_ms']:.2f}ms p95={report[name]['p95_ms']:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()